@@ -1,14 +1,47 @@
 import math
 import random
 from algorithms.bitonic_sort import bitonic_sort
+from algorithms.sorting_networks import network_sort
+from async_scheduler import RoundScheduler
 from compare_aggregate import (
+    ca_branch,
+    ca_parallel,
     compare_aggregate,
     complete_graph,
     CompareAggregateFn,
 )
+from graph_optimizer import derive_subranking
+from profiling import span
 
 
-def aav86_sort(x, k):
+def _base_sort(x, network):
+    if network is None:
+        return bitonic_sort(x)
+    return network_sort(x, network)
+
+
+def _pivot_graph(n, P_indices):
+    """
+    Builds the graph of Line 9 for the pivots P_indices: a biclique between
+    the non-pivots and the pivots plus a clique on the pivots.
+
+    Returns:
+        The non-pivot indices and the graph.
+    """
+    is_pivot = [False] * n
+    for i in P_indices:
+        is_pivot[i] = True
+    A_indices = [i for i in range(n) if not is_pivot[i]]
+    H = [(min(i_a, i_p), max(i_a, i_p)) for i_a in A_indices for i_p in P_indices]
+    H.extend(
+        (min(i_p, j_p), max(i_p, j_p))
+        for a, i_p in enumerate(P_indices)
+        for j_p in P_indices[a + 1 :]
+    )
+    return A_indices, H
+
+
+def aav86_sort(x, k, network=None):
     """
     Implementation of Algorithm 1: AAV86 sorting from "Secure Sorting and
     Selection via Function Secret Sharing" by Agarwal et al. (2024), page 34.
@@ -18,6 +51,8 @@ def aav86_sort(x, k):
     Args:
         x: A list of items to sort.
         k: The number of iterations parameter. The paper specifies k > 1 for the recursive step.
+        network: Sorting network constructor (see `sorting_networks.NETWORKS`)
+            used for the base case and the pivots. Defaults to `bitonic_sort`.
     """
     n = len(x)
 
@@ -27,7 +62,7 @@ def aav86_sort(x, k):
     # Line 1-5: Base case
     if k <= 1:
         # This part of the algorithm sorts using all pairwise comparisons.
-        return bitonic_sort(x)
+        return _base_sort(x, network)
 
     # Line 6: Recursive case for k > 1
 
@@ -38,7 +73,7 @@ def aav86_sort(x, k):
     # The list is not partitioned and we recurse with k-1, eventually hitting k=1.
     num_pivots = p - 1
     if num_pivots <= 0:
-        return aav86_sort(x, k - 1)
+        return aav86_sort(x, k - 1, network)
 
     # Line 8: Sample uniformly (without replacement) a set P of indices for pivots.
     all_indices = list(range(n))
@@ -50,7 +85,7 @@ def aav86_sort(x, k):
     xA = [x[i] for i in A_indices]
 
     # Line 12: Reorder pivot elements to obtain u.
-    u = bitonic_sort(xB)
+    u = _base_sort(xB, network)
 
     # Line 11: Partition non-pivot elements (xA) into p disjoint blocks.
     xA_partitions = [[] for _ in range(p)]
@@ -65,7 +100,7 @@ def aav86_sort(x, k):
     # Line 13: Recursively sort each partition.
     yA_partitions = []
     for i in range(p):
-        yA_partitions.append(aav86_sort(xA_partitions[i], k - 1))
+        yA_partitions.append(aav86_sort(xA_partitions[i], k - 1, network))
 
     # Line 14: Assemble the final sorted list.
     y = []
@@ -82,7 +117,15 @@ def aav86_sort_ca(x, k, CompareAggregate: CompareAggregateFn = compare_aggregate
     """
     Implementation of Algorithm 2: AAV86 sorting in the Compare-Aggregate model.
     (from Agarwal et al. 2024, page 35)
+
+    Each phase is wrapped in a `profiling.span`, so running this under
+    `profiling.profile()` yields a per-phase, per-recursion-level trace.
     """
+    with span("aav86_sort_ca", n=len(x), k=k):
+        return _aav86_sort_ca(x, k, CompareAggregate)
+
+
+def _aav86_sort_ca(x, k, CompareAggregate):
     n = len(x)
     if n <= 1:
         return x
@@ -90,16 +133,20 @@ def aav86_sort_ca(x, k, CompareAggregate: CompareAggregateFn = compare_aggregate
     # Line 1-5: Base case for k=1
     if k <= 1:
         # Line 2: Let H be a clique over V.
-        H = complete_graph(n)
+        with span("graph_build") as s:
+            H = complete_graph(n)
+            s.set(edges=len(H))
         # Line 3: Get local rank results from CompareAggregate.
-        ranks = CompareAggregate(x, H)
+        with span("ca_eval", n=n, edges=len(H)):
+            ranks = CompareAggregate(x, H)
         # Line 4: Reorder x based on the ranks to get the sorted list y.
-        y = [None] * n
-        for i, rank in enumerate(ranks):
-            if rank < n:
-                y[rank] = x[i]
-        # Line 5: Return y
-        return [item for item in y if item is not None]
+        with span("assemble"):
+            y = [None] * n
+            for i, rank in enumerate(ranks):
+                if rank < n:
+                    y[rank] = x[i]
+            # Line 5: Return y
+            return [item for item in y if item is not None]
 
     # Line 6: Recursive case for k > 1
     # Line 7: Let p = floor(n^(1/k))
@@ -108,64 +155,110 @@ def aav86_sort_ca(x, k, CompareAggregate: CompareAggregateFn = compare_aggregate
     if num_pivots <= 0:
         return aav86_sort_ca(x, k - 1, CompareAggregate)
 
-    # Line 8: Sample a set P of pivot indices.
-    all_indices = list(range(n))
-    P_indices = random.sample(all_indices, num_pivots)
-    A_indices = [i for i in all_indices if i not in P_indices]
-
-    # Line 9: Define the comparison graph H.
-    # H is a complete bipartite graph between non-pivots (A) and pivots (B=P),
-    # plus a clique on the pivots (B).
-    H = []
-    for i_a in A_indices:
-        for i_p in P_indices:
-            H.append(tuple(sorted((i_a, i_p))))
-    for i in range(len(P_indices)):
-        for j in range(i + 1, len(P_indices)):
-            H.append(tuple(sorted((P_indices[i], P_indices[j]))))
-    H = sorted(list(set(H)))
+    with span("graph_build") as s:
+        # Line 8: Sample a set P of pivot indices.
+        P_indices = random.sample(range(n), num_pivots)
+        # Line 9: Define the comparison graph H: a complete bipartite graph
+        # between non-pivots (A) and pivots (B=P), plus a clique on the pivots.
+        A_indices, H = _pivot_graph(n, P_indices)
+        s.set(edges=len(H))
 
     # Line 10: Get local rank results from CompareAggregate.
-    local_ranks = CompareAggregate(x, H)
+    with span("ca_eval", n=n, edges=len(H)):
+        local_ranks = CompareAggregate(x, H)
 
     # Line 11: Partition non-pivot elements (xA) into p disjoint blocks.
-    xA_partitions_by_idx = [[] for _ in range(p)]
-    for idx in A_indices:
-        rank = local_ranks[idx]
-        if rank < p:
-            xA_partitions_by_idx[rank].append(idx)
-
-    # Line 12: Reorder pivot elements (xB) to obtain u.
-    # This requires getting the ranks of pivots *among themselves*.
-    # The local_ranks from the main CA call include comparisons with non-pivots,
-    # so we run a smaller, separate CA call on just the pivots.
-    pivots_only_graph = [e for e in H if e[0] in P_indices and e[1] in P_indices]
-    pivot_items = [x[i] for i in P_indices]
-    # The graph for the sub-call needs indices relative to the `pivot_items` list.
-    pivots_relative_graph = [
-        (P_indices.index(i), P_indices.index(j)) for i, j in pivots_only_graph
-    ]
-    pivot_ranks_within_pivots = CompareAggregate(pivot_items, pivots_relative_graph)
-
-    sorted_pivots_indices_in_pivots_list = sorted(
-        range(len(pivot_items)), key=lambda i: pivot_ranks_within_pivots[i]
-    )
-    u = [pivot_items[j] for j in sorted_pivots_indices_in_pivots_list]
+    with span("partition"):
+        xA_partitions_by_idx = [[] for _ in range(p)]
+        for idx in A_indices:
+            xA_partitions_by_idx[local_ranks[idx]].append(idx)
+
+    # Line 12: Reorder pivot elements (xB) to obtain u. The pivots form a
+    # clique and share all their outside neighbors, so their order among
+    # themselves follows from the main call's local ranks.
+    with span("partition"):
+        pivot_ranks = derive_subranking(H, local_ranks, P_indices, check=False)
+        u = [None] * num_pivots
+        for i, rank in zip(P_indices, pivot_ranks):
+            u[rank] = x[i]
 
     # Line 13: Recursively sort each partition of non-pivot elements.
-    yA_partitions = []
-    for i in range(p):
-        partition_items = [x[j] for j in xA_partitions_by_idx[i]]
-        yA_partitions.append(aav86_sort_ca(partition_items, k - 1, CompareAggregate))
+    # The partitions are sorted independently, so their calls share rounds.
+    with span("recursion", partitions=p), ca_parallel(CompareAggregate):
+        yA_partitions = []
+        for i in range(p):
+            partition_items = [x[j] for j in xA_partitions_by_idx[i]]
+            with ca_branch(CompareAggregate):
+                yA_partitions.append(
+                    aav86_sort_ca(partition_items, k - 1, CompareAggregate)
+                )
 
     # Line 14: Assemble the final sorted list.
+    with span("assemble"):
+        y = []
+        for i in range(p):
+            y.extend(yA_partitions[i])
+            if i < len(u):
+                y.append(u[i])
+
+    # Line 15: Return y
+    return y
+
+
+async def aav86_sort_ca_async(x, k, scheduler: RoundScheduler = None):
+    """
+    Algorithm 2 (AAV86 sorting in the CA model) on an async backend.
+
+    Issues the same calls as `aav86_sort_ca`, but the partitions of a level
+    recurse concurrently: their calls are in flight together (or coalesced,
+    see `RoundScheduler`), and one partition builds its graphs while the
+    calls of the others are in flight.
+
+    Args:
+        x: A list of items to sort.
+        k: The number of iterations.
+        scheduler: The `RoundScheduler` issuing the calls. Defaults to one
+            running `compare_aggregate` in a thread pool.
+    """
+    if scheduler is None:
+        scheduler = RoundScheduler()
+    n = len(x)
+    if n <= 1:
+        return x
+
+    if k <= 1:
+        H = complete_graph(n)
+        ranks = await scheduler(x, H, scheduler.prepare(n, H))
+        y = [None] * n
+        for i, rank in enumerate(ranks):
+            y[rank] = x[i]
+        return y
+
+    p = math.floor(n ** (1 / k))
+    num_pivots = p - 1
+    if num_pivots <= 0:
+        return await aav86_sort_ca_async(x, k - 1, scheduler)
+
+    P_indices = random.sample(range(n), num_pivots)
+    A_indices, H = _pivot_graph(n, P_indices)
+    local_ranks = await scheduler(x, H, scheduler.prepare(n, H))
+
+    partitions = [[] for _ in range(p)]
+    for idx in A_indices:
+        partitions[local_ranks[idx]].append(x[idx])
+    u = [None] * num_pivots
+    pivot_ranks = derive_subranking(H, local_ranks, P_indices, check=False)
+    for i, rank in zip(P_indices, pivot_ranks):
+        u[rank] = x[i]
+
+    sorted_partitions = await scheduler.gather(
+        *(aav86_sort_ca_async(part, k - 1, scheduler) for part in partitions)
+    )
     y = []
     for i in range(p):
-        y.extend(yA_partitions[i])
+        y.extend(sorted_partitions[i])
         if i < len(u):
             y.append(u[i])
-
-    # Line 15: Return y
     return y
 
 
@@ -1,12 +1,16 @@
 import math
 import random
-from typing import Any
+from typing import Any, List
+from algorithms.utils import group_bounds
 from compare_aggregate import (
     compare_direct,
     compare_aggregate,
     complete_graph,
+    ranks_from_comparisons,
     CompareAggregateFn,
+    CompareFn,
 )
+from async_scheduler import RoundScheduler
 
 
 def max_two_iteration_valiant(x: list) -> Any:
@@ -205,6 +209,208 @@ def max_two_iteration_ca(
     return x_iter2[max_lrank_idx_final]
 
 
+async def max_two_iteration_ca_async(x: list, scheduler: RoundScheduler = None) -> Any:
+    """
+    Algorithm 5 (two iteration maximum, CA model) on an async backend.
+
+    The second round's clique over the t group maxima depends only on t, so
+    it is built (and `prepare`d) while the first call is in flight.
+
+    Args:
+        x: A list of elements.
+        scheduler: The `RoundScheduler` issuing the calls. Defaults to one
+            running `compare_aggregate` in a thread pool.
+    """
+    if scheduler is None:
+        scheduler = RoundScheduler()
+    n = len(x)
+    if n == 0:
+        return None
+    if n == 1:
+        return x[0]
+
+    t = min(n, max(1, int(n ** (2 / 3) / (2 ** (1 / 3)))))
+    size = n // t
+    parts = [range(i * size, (i + 1) * size) for i in range(t - 1)]
+    parts.append(range((t - 1) * size, n))
+    H1 = [(i, j) for part in parts for i in part for j in range(i + 1, part.stop)]
+
+    async def second_graph():
+        H2 = complete_graph(t)
+        return H2, scheduler.prepare(t, H2)
+
+    lrank_iter1, (H2, prepared) = await scheduler.gather(
+        scheduler(x, H1, scheduler.prepare(n, H1)), second_graph()
+    )
+    x_iter2 = [x[max(part, key=lrank_iter1.__getitem__)] for part in parts]
+    lrank_iter2 = await scheduler(x_iter2, H2, prepared)
+    return x_iter2[max(range(t), key=lrank_iter2.__getitem__)]
+
+
+# --- r-ROUND MAXIMUM FAMILY ---
+
+
+def max_round_schedule(n: int, rounds: int) -> List[int]:
+    """
+    Number of surviving candidates after each round of an r-round maximum,
+    with group sizes chosen to minimize the total number of edges.
+
+    Round i splits the m_{i-1} candidates into m_i groups, each forming a
+    clique, which costs about m_{i-1}^2 / (2 m_i) edges; the last round is a
+    single clique (m_r = 1). Setting the derivatives of the total to zero
+    gives m_i^3 = m_{i-1}^2 m_{i+1} / 2, whose solution is
+    ln m_i = A + B 2^i - i ln 2. For r = 2 this is t = n^(2/3) / 2^(1/3), the
+    choice of Algorithm 5.
+
+    Args:
+        n: The number of elements.
+        rounds: The number of rounds r >= 1.
+
+    Returns:
+        The list [m_1, ..., m_r] with m_r = 1. It is shorter than `rounds` if
+        groups of two already finish in fewer rounds.
+    """
+    if rounds < 1:
+        raise ValueError("rounds must be at least 1")
+    if n <= 1:
+        return []
+    B = (rounds * math.log(2) - math.log(n)) / (2**rounds - 1)
+    A = math.log(n) - B
+    schedule = []
+    m = n
+    for i in range(1, rounds):
+        target = round(math.exp(A + B * 2**i - i * math.log(2)))
+        # Every group needs at least two candidates to make progress.
+        m = max(1, min(target, (m + 1) // 2))
+        schedule.append(m)
+        if m == 1:
+            return schedule
+    schedule.append(1)
+    return schedule
+
+
+def tournament_schedule(n: int, rounds: int) -> List[int]:
+    """
+    Survivors after each round of a knockout tournament with a fixed group
+    size g = ceil(n^(1/r)) in every round.
+    """
+    if rounds < 1:
+        raise ValueError("rounds must be at least 1")
+    g = max(2, math.ceil(n ** (1 / rounds) - 1e-9))
+    schedule = []
+    m = n
+    while m > 1:
+        m = math.ceil(m / g)
+        schedule.append(m)
+    return schedule
+
+
+def _max_by_schedule(x: list, schedule: List[int], compare_ranks) -> Any:
+    """
+    Finds the maximum with one comparison round per entry of `schedule`.
+
+    In every round, the candidates are split into `schedule[i]` consecutive
+    groups, every group forms a clique, and the element with the highest
+    local rank in each group survives. `compare_ranks(values, H)` returns the
+    local ranks for the graph H over `values`.
+    """
+    if not x:
+        return None
+    candidates = list(range(len(x)))
+    for t in schedule:
+        groups = [
+            candidates[start:end] for start, end in group_bounds(len(candidates), t)
+        ]
+        # Positions of the candidates in this round's input list.
+        H = []
+        start = 0
+        for group in groups:
+            H.extend(
+                (start + a, start + b)
+                for a in range(len(group))
+                for b in range(a + 1, len(group))
+            )
+            start += len(group)
+        ranks = compare_ranks([x[i] for i in candidates], H)
+        survivors = []
+        start = 0
+        for group in groups:
+            best = max(range(len(group)), key=lambda a: ranks[start + a])
+            survivors.append(group[best])
+            start += len(group)
+        candidates = survivors
+    return x[candidates[0]]
+
+
+def _valiant_ranks(Compare: CompareFn):
+    return lambda values, H: ranks_from_comparisons(len(values), Compare(values, H))
+
+
+def max_r_iteration_valiant(
+    x: list, rounds: int, Compare: CompareFn = compare_direct
+) -> Any:
+    """
+    r-round maximum finding in Valiant's model, with the group sizes of every
+    round chosen by `max_round_schedule` to minimize the total edges.
+    For rounds=2 this is Algorithm 5 (Agarwal et al. 2024, page 56).
+
+    Each round is one `Compare` call; pass a `CountingCompareAggregate`
+    wrapping `compare_direct` to count rounds and edges.
+
+    Args:
+        x: A list of elements.
+        rounds: The number of rounds r.
+        Compare: The Compare function to use.
+
+    Returns:
+        The maximum element, or None if `x` is empty.
+    """
+    return _max_by_schedule(
+        x, max_round_schedule(len(x), rounds), _valiant_ranks(Compare)
+    )
+
+
+def max_r_iteration_ca(
+    x: list, rounds: int, CompareAggregate: CompareAggregateFn = compare_aggregate
+) -> Any:
+    """
+    r-round maximum finding in the Compare-Aggregate model, with the group
+    sizes of every round chosen by `max_round_schedule`.
+    For rounds=2 this is Algorithm 5 (Agarwal et al. 2024, page 56).
+
+    Args:
+        x: A list of elements.
+        rounds: The number of rounds r.
+        CompareAggregate: The Compare-Aggregate function to use.
+
+    Returns:
+        The maximum element, or None if `x` is empty.
+    """
+    return _max_by_schedule(x, max_round_schedule(len(x), rounds), CompareAggregate)
+
+
+def max_tournament_valiant(
+    x: list, rounds: int, Compare: CompareFn = compare_direct
+) -> Any:
+    """
+    Deterministic knockout tournament for the maximum in Valiant's model:
+    every round compares groups of the same size g = ceil(n^(1/r)).
+    """
+    return _max_by_schedule(
+        x, tournament_schedule(len(x), rounds), _valiant_ranks(Compare)
+    )
+
+
+def max_tournament_ca(
+    x: list, rounds: int, CompareAggregate: CompareAggregateFn = compare_aggregate
+) -> Any:
+    """
+    Deterministic knockout tournament for the maximum in the Compare-Aggregate
+    model: every round compares groups of the same size g = ceil(n^(1/r)).
+    """
+    return _max_by_schedule(x, tournament_schedule(len(x), rounds), CompareAggregate)
+
+
 if __name__ == "__main__":
     # Example usage for Two-Iteration Maximum Finding:
     data_for_max = [random.randint(0, 1000) for _ in range(50)]
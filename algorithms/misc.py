@@ -1,13 +1,18 @@
 """Untested AI-generated code for CA-based algorithms that might or might not actually correspond to the algorithms in the paper."""
 
 import random
-from typing import Any, Callable, List, Tuple
+from typing import Any, Callable, List, Optional, Tuple
+from algorithms.utils import marker_buckets, marker_graph, sample_order
 from compare_aggregate import (
+    ca_branch,
+    ca_fallback,
+    ca_parallel,
     compare_aggregate,
     complete_graph,
+    select_kth_CA,
     CompareAggregateFn,
 )
-
+from profiling import span
 
 # --- 5. GENERIC COMPARE-AGGREGATE PARALLEL SELECTION ---
 
@@ -17,57 +22,56 @@ def parallel_selection_CA(
     k: int,
     rounds: int,
     CompareAggregate: CompareAggregateFn = compare_aggregate,
+    rng: Optional[random.Random] = None,
 ) -> Any:
     """
     Generic parallel selection in `r` rounds (as in Table 3, using CA).
 
-    In each round, it uses a CA comparison graph to partition and reduce the
-    set of candidates. After `rounds-1` rounds, it selects the k-th element
-    from the small remaining set.
+    In each of the first `rounds-1` rounds, the candidates are compared with
+    pivots sampled from them (one biclique), which splits them into buckets,
+    and only the bucket holding the target rank is kept. The final round
+    selects the element from that bucket with a clique. The result is always
+    correct; the randomness only affects the bucket sizes.
 
     Args:
         x: A list of elements.
         k: The desired rank (0-based).
         rounds: The number of parallel rounds.
         CompareAggregate: The Compare-Aggregate function to use.
+        rng: Source of the pivot samples (default: the `random` module).
 
     Returns:
-        The k-th smallest element.
+        The k-th smallest element, or None if `x` is empty.
+
+    Raises:
+        IndexError: If k is out of range.
     """
+    if not x:
+        return None
+    if not 0 <= k < len(x):
+        raise IndexError(f"k={k} out of range for {len(x)} elements")
     S = x[:]
     for r in range(rounds - 1):
-        if len(S) <= max(k, 2):
+        if len(S) <= 2:
             break
 
         # Sample pivots to partition the current set S
         num_pivots = max(2, int(len(S) ** (1.0 / (rounds - r))))
-        pivots = random.sample(S, min(num_pivots, len(S)))
+        pivots = sorted((rng or random).sample(range(len(S)), min(num_pivots, len(S))))
 
-        # Use CA to compare every element in S to every pivot
-        H = [(i, j) for i in range(len(S)) for j in range(len(pivots))]
-        # The ranks are computed on the combined list of S and pivots
-        local_ranks = CompareAggregate(S + pivots, H)
-
-        # Prune S based on the ranks. A naive approach is to keep the
-        # candidates with the lowest ranks relative to the pivots.
-        paired = sorted(zip(S, local_ranks[: len(S)]), key=lambda t: t[1])
-        S = [xi for xi, rank in paired[: max(k, 2)]]
+        # Use CA to compare every element in S to every pivot, then keep the
+        # bucket (between two consecutive pivots) that holds the k-th element.
+        local_ranks = CompareAggregate(S, marker_graph(len(S), pivots))
+        for bucket in marker_buckets(local_ranks, len(S), pivots):
+            if k < len(bucket):
+                break
+            k -= len(bucket)
+        S = [S[i] for i in bucket]
 
     # Final selection among the remaining candidates in S
-    if not S:
-        return None  # Should not happen with valid inputs
     if len(S) == 1:
         return S[0]
-
-    H_final = complete_graph(len(S))
-    ranks = CompareAggregate(S, H_final)
-    # The desired element is the one with rank k-1 in the final set
-    try:
-        idx = ranks.index(k - 1)
-        return S[idx]
-    except (ValueError, IndexError):
-        # Fallback for edge cases
-        return sorted(S)[k - 1 if k > 0 else 0]
+    return select_kth_CA(S, k, CompareAggregate)
 
 
 # --- 6. SORTED TOP-k VIA ROUNDS (Braverman et al.) ---
@@ -78,15 +82,22 @@ def sorted_top_k_parallel_CA(
     k: int,
     rounds: int,
     CompareAggregate: CompareAggregateFn = compare_aggregate,
+    rng: Optional[random.Random] = None,
 ) -> List[Any]:
     """
     Computes sorted top-k in `r` rounds, inspired by Braverman et al. [21].
 
+    Each of the first `rounds-1` rounds compares the candidates with pivots
+    sampled from them and keeps the lowest buckets (between consecutive
+    pivots) until they hold at least k elements, so the top k always
+    survive; the final round sorts the survivors with a clique.
+
     Args:
         x: A list of elements.
         k: The number of top elements to find.
         rounds: The number of parallel rounds.
         CompareAggregate: The Compare-Aggregate function to use.
+        rng: Source of the pivot samples (default: the `random` module).
 
     Returns:
         A sorted list of the top `k` elements.
@@ -97,14 +108,17 @@ def sorted_top_k_parallel_CA(
             break
         # Use random pivots to parallelize, similar to parallel sort
         num_pivots = max(2, int(len(S) ** (1.0 / (rounds - r))))
-        pivots = random.sample(S, min(num_pivots, len(S)))
+        pivots = sorted((rng or random).sample(range(len(S)), min(num_pivots, len(S))))
 
         # Partition S via CA by comparing every element to every pivot
-        H = [(i, j) for i in range(len(S)) for j in range(len(pivots))]
-        local_ranks = CompareAggregate(S + pivots, H)
-        paired = sorted(zip(S, local_ranks[: len(S)]), key=lambda t: t[1])
-        # Keep the top candidates
-        S = [xi for xi, rank in paired[: max(k, 2)]]
+        local_ranks = CompareAggregate(S, marker_graph(len(S), pivots))
+        # Keep the lowest buckets, whole, until they hold the top k
+        kept: List[int] = []
+        for bucket in marker_buckets(local_ranks, len(S), pivots):
+            if len(kept) >= k:
+                break
+            kept.extend(bucket)
+        S = [S[i] for i in sorted(kept)]
 
     # Final CA-sort on the reduced set to get the sorted top-k
     if not S:
@@ -123,6 +137,7 @@ def sorted_top_k_braverman_CA(
     k: int,
     r: int,
     CompareAggregate: CompareAggregateFn = compare_aggregate,
+    rng: Optional[random.Random] = None,
 ) -> List[Any]:
     """
     Sorted top-k in `r` rounds (CA-model), following Braverman et al. [21].
@@ -133,6 +148,7 @@ def sorted_top_k_braverman_CA(
         k: The number of top elements to find.
         r: The number of rounds.
         CompareAggregate: The Compare-Aggregate function to use.
+        rng: Source of the pivot samples (default: the `random` module).
 
     Returns:
         A sorted list of the top `k` elements.
@@ -145,10 +161,10 @@ def sorted_top_k_braverman_CA(
         num_pivots = min(int(k**0.5), len(S))
         if num_pivots == 0 and len(S) > 0:
             num_pivots = 1
-        pivots = sorted(random.sample(S, num_pivots))
+        pivots = sorted((rng or random).sample(S, num_pivots))
 
         # Partition S into blocks by pivots (use CA bipartite graph)
-        biclique = [(i, j) for i in range(len(S)) for j in range(len(pivots))]
+        biclique = [(i, len(S) + j) for i in range(len(S)) for j in range(len(pivots))]
         ranks = CompareAggregate(S + pivots, biclique)
 
         # Filter to keep elements likely in top-k
@@ -166,77 +182,124 @@ def sorted_top_k_braverman_CA(
 
 
 def median_BB90_4iter_CA(
-    x: List[Any], CompareAggregate: CompareAggregateFn = compare_aggregate
+    x: List[Any],
+    CompareAggregate: CompareAggregateFn = compare_aggregate,
+    spread: float = 1.0,
+    max_attempts: int = 3,
+    rng: Optional[random.Random] = None,
 ) -> Any:
     """
     4-iteration BB90 median algorithm (CA version).
     (App. B.2, Alg. 8, p. 64 of Agarwal et al. 2024)
 
+    The four rounds are: a clique on a sample S of size sqrt(n), a biclique
+    between x and two markers from S (window U of about n^(3/4) elements), a
+    biclique between U and about 2 n^(1/4) markers Z sampled from U (narrowing
+    the window to a single bucket of about sqrt(n) elements), and a final
+    clique on that bucket. Every round uses O(n) edges. The markers are
+    elements of x, compared under the strict order of `compare_aggregate`
+    (see `algorithms.utils`), so the cost stays O(n) with many equal values.
+
+    If the window U misses the median (probability about 5% for the default
+    `spread`), round 2 is repeated with a window twice as wide, costing one
+    extra round and 2n edges; after `max_attempts` misses the algorithm falls
+    back to a clique over all of x. Fallbacks are reported through
+    `ca_fallback`; use a `CountingCompareAggregate` to count them along with
+    the rounds and edges.
+
     Args:
         x: A list of elements.
         CompareAggregate: The Compare-Aggregate function to use.
+        spread: Half-width of the window around the sample median, in units
+            of sqrt(|S|). Larger values make fallbacks rarer and U larger.
+        max_attempts: Number of (widening) windows tried before falling back
+            to a full clique.
+        rng: Source of the samples S and Z (default: the `random` module).
 
     Returns:
-        The median of the list `x`.
+        The median (the element of rank n // 2, 0-based) of the list `x`.
     """
+    with span("median_BB90_4iter_CA", n=len(x)):
+        return _median_BB90_4iter_CA(
+            x, CompareAggregate, spread, max_attempts, rng or random
+        )
+
+
+def _bb90_window(x, S_sorted, delta, CompareAggregate):
+    """
+    Compares every element of x with the markers x1, x2 at +-delta around the
+    median of `S_sorted` (indices into x). Returns the number of elements
+    below the window and the indices of the elements inside it.
+    """
+    n = len(x)
+    markers = [
+        S_sorted[max(0, len(S_sorted) // 2 - delta)],
+        S_sorted[min(len(S_sorted) - 1, len(S_sorted) // 2 + delta)],
+    ]
+    with span("graph_build") as sp:
+        H = marker_graph(n, markers)
+        sp.set(edges=len(H))
+    with span("ca_eval", n=n, edges=len(H)):
+        ranks = CompareAggregate(x, H)
+    with span("partition"):
+        below, U, _ = marker_buckets(ranks, n, markers)
+    return len(below), U
+
+
+def _median_BB90_4iter_CA(x, CompareAggregate, spread, max_attempts, rng):
     n = len(x)
+    target = n // 2
     if n <= 5:
-        return select_kth_CA(x, n // 2, CompareAggregate)
+        with span("ca_eval", n=n, edges=n * (n - 1) // 2):
+            return select_kth_CA(x, target, CompareAggregate)
 
-    # 1. Sample S (size sqrt(n)) and T (size n^(2/3))
+    # 1. Sample S (size sqrt(n)) and CA-sort it (clique over S).
     s_size = int(n**0.5)
-    t_size = int(n ** (2 / 3))
-    all_indices = list(range(n))
-    random.shuffle(all_indices)
-    S_indices = all_indices[:s_size]
-    T_indices = all_indices[s_size : s_size + t_size]
-    S = [x[i] for i in S_indices]
-    T = [x[i] for i in T_indices]
-
-    # 2. CA-sort S to find markers x1 and x2
-    S_sorted = sorted_top_k_CA(S, len(S), CompareAggregate)
-    x1 = S_sorted[len(S) // 2 - int(len(S) ** 0.5)]
-    x2 = S_sorted[len(S) // 2 + int(len(S) ** 0.5)]
-
-    # 3. Filter X to get elements U between markers x1 and x2
-    U = [xi for xi in x if x1 <= xi <= x2]
-    if len(U) > 4 * n**0.75:
-        # Fallback to full CA-selection if U is too large
-        return select_kth_CA(x, n // 2, CompareAggregate)
-
-    # 4. CA-sort T to find markers y1 and y2
-    T_sorted = sorted_top_k_CA(T, len(T), CompareAggregate)
-    y1 = T_sorted[len(T) // 2 - int(len(T) ** 0.5)]
-    y2 = T_sorted[len(T) // 2 + int(len(T) ** 0.5)]
-
-    # 5. Partition T to get V between markers y1 and y2
-    V = [ti for ti in T if y1 <= ti <= y2]
-
-    # 6. Take m markers Z from V and compare U with them
-    m = int(n**0.25)
-    if m < 2:
-        m = 2
-    if len(V) < m:
-        Z = V
+    with span("ca_eval", n=s_size, edges=s_size * (s_size - 1) // 2):
+        S_sorted = sample_order(x, s_size, CompareAggregate, rng)
+
+    # 2-3. Markers x1 and x2 around the sample median, then compare every
+    # element with them (biclique with 2n edges). If the window misses the
+    # median, it is widened around the same sample and the round repeated.
+    for attempt in range(max_attempts):
+        delta = max(1, int(spread * 2**attempt * len(S_sorted) ** 0.5))
+        below, U = _bb90_window(x, S_sorted, delta, CompareAggregate)
+        if below <= target < below + len(U):
+            break
+        ca_fallback(CompareAggregate, "window_missed")
     else:
-        Z = [V[int(i * len(V) / m)] for i in range(m)]
-
-    if not Z:  # If V was empty, Z will be empty.
-        # Fallback to sorting U if there are no markers in Z.
-        return select_kth_CA(U, len(U) // 2, CompareAggregate)
-
-    # Compare U with markers Z. This step is simplified in the paper.
-    # A full implementation would use the ranks to find a smaller window for the median.
-    # For this implementation, we proceed to sort the filtered set U.
-    if len(U) > 4 * n**0.75:
-        return select_kth_CA(U, len(U) // 2, CompareAggregate)
-
-    # 7. Final CA-clique on U to find the median
-    return select_kth_CA(U, len(U) // 2, CompareAggregate)
+        ca_fallback(CompareAggregate, "clique")
+        with span("ca_eval", n=n, edges=n * (n - 1) // 2):
+            return select_kth_CA(x, target, CompareAggregate)
+    target -= below
+
+    # 4-5. Compare U with m = 2 n^(1/4) markers Z sampled from U (biclique
+    # with |U| * m = O(n) edges), which splits U into buckets.
+    m = max(2, int(2 * n**0.25))
+    Z = sorted(rng.sample(range(len(U)), min(m, len(U))))
+    with span("graph_build") as sp:
+        H = marker_graph(len(U), Z)
+        sp.set(edges=len(H))
+    with span("ca_eval", n=len(U), edges=len(H)):
+        ranks = CompareAggregate([x[i] for i in U], H)
+
+    # 6. Narrow the window to the bucket that contains the median.
+    with span("partition"):
+        for bucket in marker_buckets(ranks, len(U), Z):
+            if target < len(bucket):
+                break
+            target -= len(bucket)
+        W = [x[U[a]] for a in bucket]
+
+    # 7. Final CA-clique on the bucket to find the median.
+    with span("ca_eval", n=len(W), edges=len(W) * (len(W) - 1) // 2):
+        return select_kth_CA(W, target, CompareAggregate)
 
 
 def max_four_iteration_CA(
-    x: List[Any], CompareAggregate: CompareAggregateFn = compare_aggregate
+    x: List[Any],
+    CompareAggregate: CompareAggregateFn = compare_aggregate,
+    rng: Optional[random.Random] = None,
 ) -> Any:
     """
     4-iteration maximum finding algorithm (CA model, Algorithm 7, p. 60).
@@ -244,6 +307,7 @@ def max_four_iteration_CA(
     Args:
         x: A list of elements.
         CompareAggregate: The Compare-Aggregate function to use.
+        rng: Source of the pivot sample (default: the `random` module).
 
     Returns:
         The maximum element in the list `x`.
@@ -254,7 +318,7 @@ def max_four_iteration_CA(
         return max(x) if x else None
 
     # 1. Sample p pivots and find their maximum using a CA clique.
-    pivot_indices = random.sample(range(n), p_size)
+    pivot_indices = (rng or random).sample(range(n), p_size)
     pivots = [x[i] for i in pivot_indices]
     H_piv = complete_graph(len(pivots))
     ranks_piv = CompareAggregate(pivots, H_piv)
@@ -276,14 +340,16 @@ def max_four_iteration_CA(
     ]
 
     maxima = []
-    for g in groups:
-        if not g:
-            continue
-        H = complete_graph(len(g))
-        ranks = CompareAggregate(g, H)
-        max_rank_in_group = max(ranks)
-        idx = ranks.index(max_rank_in_group)
-        maxima.append(g[idx])
+    with ca_parallel(CompareAggregate):
+        for g in groups:
+            if not g:
+                continue
+            with ca_branch(CompareAggregate):
+                H = complete_graph(len(g))
+                ranks = CompareAggregate(g, H)
+            max_rank_in_group = max(ranks)
+            idx = ranks.index(max_rank_in_group)
+            maxima.append(g[idx])
 
     if not maxima:
         return pivot_max  # Should not be reached if survivors is not empty
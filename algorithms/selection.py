@@ -0,0 +1,272 @@
+"""
+Selection of many ranks (e.g. the p50, p90, p99 and p99.9 quantiles) of the
+same input in one shared round budget (CA model).
+
+The rounds follow the BB90 median (`median_BB90_4iter_CA`), shared between
+all targets:
+
+1. A clique on a random sample S of size sqrt(n) sorts it.
+2. For every target rank r = pn, two markers from S at two standard
+   deviations around the sample position of r bound a window of about
+   4n sqrt(p(1 - p) / |S|) elements, at most 2n^(3/4). All markers go into
+   one biclique with x (n edges per marker), which tells every element's
+   bucket between consecutive markers and thus every window's contents and
+   offset.
+3. The windows are merged where they overlap. Every merged window U is
+   compared with m = 2n^(1/4) markers Z sampled from it, all windows in one
+   call (|U| * m = O(n) edges each). This narrows every target to the bucket
+   between two markers of Z that contains it, of about |U| / m = O(sqrt(n))
+   elements.
+4. One call over a clique per target bucket orders them all.
+
+This costs |S|^2/2 + 2qn + m * sum(|U|) + sum(|W|^2/2) edges for q targets,
+windows U and buckets W: O(qn), about 10n per central quantile (as for the
+median) and less for extreme ones, in four rounds for all targets together.
+A window that misses its target is widened around the same sample in an
+extra biclique round, as in the median; both kinds of fallback are reported
+with `ca_fallback`.
+"""
+
+import math
+import random
+from typing import Any, Dict, List, Sequence, Tuple
+
+from algorithms.utils import marker_buckets, marker_graph, sample_order
+from compare_aggregate import (
+    ca_fallback,
+    compare_aggregate,
+    merge_calls,
+    sorted_top_k_CA,
+    split_ranks,
+    CompareAggregateFn,
+)
+from profiling import span
+
+# Inputs up to this size are sorted with a single clique.
+_CLIQUE_THRESHOLD = 64
+
+
+def multi_select_ca(
+    x: List[Any],
+    ranks: Sequence[int],
+    CompareAggregate: CompareAggregateFn = compare_aggregate,
+    spread: float = 1.0,
+    max_attempts: int = 3,
+) -> List[Any]:
+    """
+    Selects the elements of several ranks of x, sharing all rounds.
+
+    Args:
+        x: A list of elements.
+        ranks: The target ranks (0-based), in any order.
+        CompareAggregate: The Compare-Aggregate function to use.
+        spread: Half-width of every window around its target's sample
+            position, in units of two standard deviations of that position.
+            Larger values make fallbacks rarer and the windows larger.
+        max_attempts: Number of (widening) windows tried per target before
+            falling back to a clique over all of x.
+
+    Returns:
+        The element of every rank in `ranks`, in the same order, or None for
+        every rank if x is empty.
+
+    Raises:
+        IndexError: If a rank is out of range.
+    """
+    with span("multi_select_ca", n=len(x), targets=len(ranks)):
+        return _multi_select_ca(x, ranks, CompareAggregate, spread, max_attempts)
+
+
+def quantiles_ca(
+    x: List[Any],
+    quantiles: Sequence[float],
+    CompareAggregate: CompareAggregateFn = compare_aggregate,
+) -> List[Any]:
+    """
+    The given quantiles (e.g. `[0.5, 0.9, 0.99]`) of x, via `multi_select_ca`.
+    The q-quantile is the element of rank floor(q * n), capped at n - 1.
+    """
+    n = len(x)
+    if n == 0:
+        return [None] * len(quantiles)
+    ranks = [min(n - 1, math.floor(q * n)) for q in quantiles]
+    return multi_select_ca(x, ranks, CompareAggregate)
+
+
+def _window_round(
+    x: List[Any],
+    S_sorted: List[int],
+    targets: List[int],
+    spread: float,
+    CompareAggregate: CompareAggregateFn,
+) -> Dict[int, Tuple[int, List[int]]]:
+    """
+    One biclique between x and the markers of all targets, taken from the
+    sorted sample indices `S_sorted`.
+
+    Returns:
+        For every target its window as `(below, indices)`: the number of
+        elements below the window and the indices of the elements in it.
+        Targets the window misses are left out.
+    """
+    n, s = len(x), len(S_sorted)
+    # Marker positions in S; None stands for an open end.
+    bounds = {}
+    for r in targets:
+        position = r * s // n
+        # The number of sample elements below the target is binomial with
+        # standard deviation sqrt(s p (1 - p)); extreme ranks get narrow
+        # windows.
+        p = (r + 0.5) / n
+        half_width = max(1, math.ceil(spread * 2 * math.sqrt(s * p * (1 - p))))
+        lo = position - half_width
+        hi = position + half_width
+        bounds[r] = (lo if lo >= 0 else None, hi if hi < s else None)
+    positions = sorted({p for lo_hi in bounds.values() for p in lo_hi if p is not None})
+    markers = [S_sorted[p] for p in positions]
+    slot = {p: b for b, p in enumerate(positions)}
+
+    with span("graph_build") as sp:
+        H = marker_graph(n, markers)
+        sp.set(edges=len(H))
+    with span("ca_eval", n=n, edges=len(H)):
+        ranks = CompareAggregate(x, H)
+
+    with span("partition"):
+        buckets = marker_buckets(ranks, n, markers)
+        windows = {}
+        for r in targets:
+            lo, hi = bounds[r]
+            # Buckets first..last lie between the two markers.
+            first = slot[lo] + 1 if lo is not None else 0
+            last = slot[hi] if hi is not None else len(markers)
+            below = sum(len(bucket) for bucket in buckets[:first])
+            inside = sum(len(bucket) for bucket in buckets[first : last + 1])
+            if below <= r < below + inside:
+                windows[r] = (
+                    below,
+                    sorted(i for bucket in buckets[first : last + 1] for i in bucket),
+                )
+    return windows
+
+
+def _narrow_windows(
+    x: List[Any],
+    members: List[List[int]],
+    n: int,
+    CompareAggregate: CompareAggregateFn,
+) -> List[List[List[int]]]:
+    """
+    Splits every window into buckets with markers sampled from it, in one
+    call over a biclique per window.
+
+    Args:
+        x: The input.
+        members: The indices of every window, in index order.
+        n: The input size, which sets the number of markers per window.
+        CompareAggregate: The Compare-Aggregate function to use.
+
+    Returns:
+        For every window, its buckets in ascending order, each holding its
+        indices in index order.
+    """
+    m = max(2, int(2 * n**0.25))
+    with span("graph_build") as sp:
+        calls = []
+        markers = []
+        for group in members:
+            Z = sorted(random.sample(range(len(group)), min(m, len(group))))
+            markers.append(Z)
+            calls.append(([x[i] for i in group], marker_graph(len(group), Z)))
+        merged_x, merged_H, offsets = merge_calls(calls)
+        sp.set(edges=len(merged_H))
+    with span("ca_eval", n=len(merged_x), edges=len(merged_H)):
+        local_ranks = split_ranks(CompareAggregate(merged_x, merged_H), offsets)
+    with span("partition"):
+        return [
+            [[group[a] for a in bucket] for bucket in marker_buckets(r, len(group), Z)]
+            for group, Z, r in zip(members, markers, local_ranks)
+        ]
+
+
+def _multi_select_ca(x, ranks, CompareAggregate, spread, max_attempts):
+    n = len(x)
+    if n == 0:
+        return [None] * len(ranks)
+    for r in ranks:
+        if not 0 <= r < n:
+            raise IndexError(f"rank {r} out of range for {n} elements")
+    if n <= _CLIQUE_THRESHOLD:
+        with span("ca_eval", n=n, edges=n * (n - 1) // 2):
+            y = sorted_top_k_CA(x, n, CompareAggregate)
+        return [y[r] for r in ranks]
+
+    # 1. Sample S (size sqrt(n)) and CA-sort it (clique over S).
+    s_size = int(n**0.5)
+    with span("ca_eval", n=s_size, edges=s_size * (s_size - 1) // 2):
+        S_sorted = sample_order(x, s_size, CompareAggregate)
+
+    # 2. One biclique with the markers of all targets. Targets whose window
+    # misses them get a wider window in another round.
+    windows: Dict[int, Tuple[int, List[int]]] = {}
+    pending = sorted(set(ranks))
+    for attempt in range(max_attempts):
+        windows.update(
+            _window_round(x, S_sorted, pending, spread * 2**attempt, CompareAggregate)
+        )
+        pending = [r for r in pending if r not in windows]
+        if not pending:
+            break
+        for _ in pending:
+            ca_fallback(CompareAggregate, "window_missed")
+    else:
+        for r in pending:
+            ca_fallback(CompareAggregate, "clique")
+            windows[r] = (0, list(range(n)))
+
+    # 3. Merge overlapping windows (intervals of global ranks).
+    with span("partition"):
+        groups: List[Tuple[int, set]] = []
+        for below, indices in sorted(
+            set((below, tuple(indices)) for below, indices in windows.values())
+        ):
+            if groups and below < groups[-1][0] + len(groups[-1][1]):
+                groups[-1][1].update(indices)
+            else:
+                groups.append((below, set(indices)))
+        # Index order keeps ties broken as in a call over all of x.
+        members = [sorted(indices) for _, indices in groups]
+    buckets = _narrow_windows(x, members, n, CompareAggregate)
+
+    # 4. Find the bucket of every target, then order all of them in one call
+    # over a union of cliques.
+    with span("partition"):
+        targets: Dict[Tuple[int, int], Tuple[int, List[int]]] = {}
+        for r in set(ranks):
+            for (below, _), group, group_buckets in zip(groups, members, buckets):
+                if below <= r < below + len(group):
+                    break
+            offset = below
+            for b, bucket in enumerate(group_buckets):
+                if r < offset + len(bucket):
+                    targets[(below, b)] = (offset, bucket)
+                    break
+                offset += len(bucket)
+        final = sorted(targets.values())
+        calls = [
+            (
+                [x[i] for i in bucket],
+                [(a, b) for a in range(len(bucket)) for b in range(a + 1, len(bucket))],
+            )
+            for _, bucket in final
+        ]
+        merged_x, merged_H, offsets = merge_calls(calls)
+    with span("ca_eval", n=len(merged_x), edges=len(merged_H)):
+        local_ranks = split_ranks(CompareAggregate(merged_x, merged_H), offsets)
+
+    with span("assemble"):
+        selected = {}
+        for (below, bucket), bucket_ranks in zip(final, local_ranks):
+            for i, rank in zip(bucket, bucket_ranks):
+                selected[below + rank] = x[i]
+        return [selected[r] for r in ranks]
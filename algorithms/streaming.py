@@ -0,0 +1,205 @@
+"""
+Sliding-window top-k over a stream, maintained incrementally in the
+Compare-Aggregate model.
+
+Instead of the whole window, `SlidingWindowTopK` keeps only its k-skyband:
+the elements that fewer than k later, better elements dominate. All other
+elements expire before they could re-enter the top-k, since every element
+dominating them expires later.
+
+Every micro-batch of b arrivals costs one CompareAggregate call over the
+candidates and the arrivals, with b*c + b(b-1)/2 edges for c candidates:
+the arrivals are compared with each other and with every candidate, and the
+candidates' order is already known. Expiry is free.
+
+The cost therefore depends on the skyband size c. For values in random
+order, c is O(k log(W/k)) for a window of W elements. In the worst case c
+is the whole window: on a stream that only gets worse (increasing values
+for the k smallest, decreasing ones for the k largest), no element is ever
+beaten by a later one, every element stays a candidate until it expires,
+and a batch costs O(b*W) edges. A stream that only gets better keeps just k
+candidates.
+"""
+
+import bisect
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+from compare_aggregate import compare_aggregate, CompareAggregateFn
+
+
+class SlidingWindowTopK:
+    """
+    The top-k of the most recent elements of a stream.
+
+    The window is count-based (the last `window` elements), time-based (the
+    elements with a timestamp in `(now - duration, now]`), or both. Streams
+    must arrive in timestamp order.
+
+    Ties are broken by arrival, as in `compare_aggregate`: of two equal
+    values, the later one counts as larger.
+
+    Args:
+        k: The number of top elements to maintain.
+        window: The maximum number of elements in the window, or None.
+        duration: The time span of the window, or None.
+        CompareAggregate: The Compare-Aggregate function to use.
+        largest: If False, maintain the k smallest elements in ascending
+            order; if True, the k largest in descending order.
+    """
+
+    def __init__(
+        self,
+        k: int,
+        window: Optional[int] = None,
+        duration: Optional[float] = None,
+        CompareAggregate: CompareAggregateFn = compare_aggregate,
+        largest: bool = False,
+    ):
+        if k < 1:
+            raise ValueError("k must be at least 1")
+        if window is not None and window < 1:
+            raise ValueError("window must be at least 1")
+        self.k = k
+        self.window = window
+        self.duration = duration
+        self.CompareAggregate = CompareAggregate
+        self.largest = largest
+        self.seen = 0
+        # The candidates in arrival order: values, arrival numbers,
+        # timestamps, and their positions in the candidates' top-k order
+        # (0 is the best).
+        self._values: List[Any] = []
+        self._arrivals: List[int] = []
+        self._timestamps: List[Optional[float]] = []
+        self._positions: List[int] = []
+
+    @property
+    def num_candidates(self) -> int:
+        return len(self._values)
+
+    def update(
+        self, batch: Iterable[Any], timestamps: Optional[Iterable[float]] = None
+    ) -> List[Any]:
+        """
+        Adds a micro-batch of elements and returns the new top-k.
+
+        Args:
+            batch: The arriving elements, in arrival order.
+            timestamps: The arrival time of every element (time-based windows).
+
+        Returns:
+            The top-k of the current window, best first.
+        """
+        batch = list(batch)
+        if timestamps is None:
+            if self.duration is not None:
+                raise ValueError("time-based windows need timestamps")
+            timestamps = [None] * len(batch)
+        else:
+            timestamps = list(timestamps)
+            if len(timestamps) != len(batch):
+                raise ValueError("need one timestamp per element")
+        if batch:
+            self._insert(batch, timestamps)
+        now = timestamps[-1] if batch and self.duration is not None else None
+        self._expire(now)
+        return self.top_k()
+
+    def advance(self, now: float) -> List[Any]:
+        """Expires the elements older than `now - duration` and returns the top-k."""
+        self._expire(now)
+        return self.top_k()
+
+    def top_k(self) -> List[Any]:
+        """Returns the top-k of the current window, best first."""
+        best = sorted(range(self.num_candidates), key=self._positions.__getitem__)
+        return [self._values[i] for i in best[: self.k]]
+
+    def _insert(self, batch: List[Any], timestamps: List[Optional[float]]) -> None:
+        c, b = self.num_candidates, len(batch)
+        # Arrivals against each other and against every candidate. Vertices
+        # are in arrival order, so ties go to the later element.
+        H = [(i, j) for j in range(c, c + b) for i in range(j)]
+        ranks = self.CompareAggregate(self._values + batch, H)
+        m = c + b
+        # A candidate's rank counts the arrivals below it; its old position
+        # counts the candidates.
+        order = [0] * m
+        old = self._positions
+        for i in range(c):
+            below_old = (c - 1 - old[i]) if self.largest else old[i]
+            order[i] = below_old + ranks[i]
+        for i in range(c, m):
+            order[i] = ranks[i]
+        if self.largest:
+            order = [m - 1 - r for r in order]
+
+        self._values.extend(batch)
+        self._arrivals.extend(range(self.seen, self.seen + b))
+        self._timestamps.extend(timestamps)
+        self.seen += b
+        self._positions = order
+        self._prune()
+
+    def _prune(self) -> None:
+        """Drops the candidates that at least k later candidates beat."""
+        later: List[int] = []
+        keep = [False] * self.num_candidates
+        for i in range(self.num_candidates - 1, -1, -1):
+            position = self._positions[i]
+            keep[i] = bisect.bisect_left(later, position) < self.k
+            bisect.insort(later, position)
+        self._keep(keep)
+
+    def _expire(self, now: Optional[float]) -> None:
+        keep = [True] * self.num_candidates
+        for i in range(self.num_candidates):
+            if self.window is not None and self._arrivals[i] < self.seen - self.window:
+                keep[i] = False
+            elif now is not None and self._timestamps[i] <= now - self.duration:
+                keep[i] = False
+        self._keep(keep)
+
+    def _keep(self, keep: List[bool]) -> None:
+        if all(keep):
+            return
+        kept = [i for i in range(self.num_candidates) if keep[i]]
+        # Renumber the positions of the kept candidates from 0.
+        renumbered = [0] * len(kept)
+        for position, j in enumerate(
+            sorted(range(len(kept)), key=lambda j: self._positions[kept[j]])
+        ):
+            renumbered[j] = position
+        self._values = [self._values[i] for i in kept]
+        self._arrivals = [self._arrivals[i] for i in kept]
+        self._timestamps = [self._timestamps[i] for i in kept]
+        self._positions = renumbered
+
+
+def stream_top_k(
+    batches: Iterable[Iterable[Any]],
+    k: int,
+    window: Optional[int] = None,
+    duration: Optional[float] = None,
+    CompareAggregate: CompareAggregateFn = compare_aggregate,
+    largest: bool = False,
+) -> Iterator[List[Any]]:
+    """
+    Yields the sliding-window top-k after every micro-batch of a stream.
+
+    Args:
+        batches: The micro-batches. For time-based windows (`duration` set),
+            every element is a `(timestamp, value)` pair.
+        k, window, duration, CompareAggregate, largest: See
+            `SlidingWindowTopK`.
+
+    Yields:
+        The top-k of the window after each batch, best first.
+    """
+    top = SlidingWindowTopK(k, window, duration, CompareAggregate, largest)
+    for batch in batches:
+        if duration is None:
+            yield top.update(batch)
+        else:
+            pairs: List[Tuple[float, Any]] = list(batch)
+            yield top.update([v for _, v in pairs], [t for t, _ in pairs])
@@ -0,0 +1,156 @@
+"""
+Exact two-round sorted top-k in the Compare-Aggregate model, for one or many
+independent inputs at once.
+
+Round 1 splits the n elements into t groups, each forming a clique, and keeps
+the k best elements of every group. Round 2 is a clique over the (at most tk)
+survivors, which orders them. This costs about n^2 / (2t) + (tk)^2 / 2 edges,
+minimized by t = (n^2 / (2 k^2))^(1/3) (the top-k analogue of Algorithm 5).
+The graphs depend only on n and k, never on the data, so many inputs can
+share the same two CompareAggregate calls (see `batched_sorted_top_k_ca`).
+"""
+
+from typing import Any, List
+
+from algorithms.utils import group_bounds
+from compare_aggregate import (
+    compare_aggregate,
+    complete_graph,
+    merge_calls,
+    split_ranks,
+    CompareAggregateFn,
+)
+
+
+def _clique_edges(size: int) -> int:
+    return size * (size - 1) // 2
+
+
+def top_k_groups(n: int, k: int) -> int:
+    """
+    Number of round-1 groups for a top-k over n elements, or 0 if a single
+    clique over all elements is cheaper.
+    """
+    if k <= 0 or n <= 2 * k:
+        return 0
+    t = round((n * n / (2 * k * k)) ** (1 / 3))
+    # Groups of at most k elements would keep everything.
+    t = min(t, n // (k + 1))
+    if t <= 1:
+        return 0
+    if top_k_edges(n, k, t) >= _clique_edges(n):
+        return 0
+    return t
+
+
+def top_k_edges(n: int, k: int, t: int = None) -> int:
+    """Number of edges of the two-round top-k plan with t groups."""
+    if t is None:
+        t = top_k_groups(n, k)
+    if t == 0:
+        return _clique_edges(n)
+    bounds = group_bounds(n, t)
+    survivors = sum(min(k, end - start) for start, end in bounds)
+    return sum(_clique_edges(end - start) for start, end in bounds) + _clique_edges(
+        survivors
+    )
+
+
+def top_k_rounds(n: int, k: int) -> int:
+    """Number of CompareAggregate rounds the top-k over n elements takes."""
+    if n <= 1:
+        return 0
+    return 2 if top_k_groups(n, k) else 1
+
+
+def batched_sorted_top_k_ca(
+    instances: List[List[Any]],
+    k: int,
+    CompareAggregate: CompareAggregateFn = compare_aggregate,
+    largest: bool = False,
+) -> List[List[int]]:
+    """
+    Sorted top-k of many independent inputs, sharing two CompareAggregate
+    calls between all of them.
+
+    Ties are broken by index, as in `compare_aggregate`: among equal values,
+    the one with the larger index counts as larger.
+
+    Args:
+        instances: The inputs.
+        k: The number of elements to return per input.
+        CompareAggregate: The Compare-Aggregate function to use.
+        largest: If False, return the k smallest elements in ascending order;
+            if True, the k largest in descending order.
+
+    Returns:
+        For every input, the indices of its top-k elements, in order.
+    """
+    # Round 1: group cliques; every group keeps its k best elements.
+    candidates: List[List[int]] = [list(range(len(x))) for x in instances]
+    round1 = [i for i, x in enumerate(instances) if top_k_groups(len(x), k)]
+    if round1:
+        calls = []
+        for i in round1:
+            H = []
+            for start, end in group_bounds(
+                len(instances[i]), top_k_groups(len(instances[i]), k)
+            ):
+                H.extend((a, b) for a in range(start, end) for b in range(a + 1, end))
+            calls.append((instances[i], H))
+        x, H, offsets = merge_calls(calls)
+        ranks = split_ranks(CompareAggregate(x, H), offsets)
+        for i, instance_ranks in zip(round1, ranks):
+            n = len(instances[i])
+            kept = []
+            for start, end in group_bounds(n, top_k_groups(n, k)):
+                size = end - start
+                for a in range(start, end):
+                    r = instance_ranks[a]
+                    if (r >= size - k) if largest else (r < k):
+                        kept.append(a)
+            candidates[i] = kept
+
+    # Round 2: a clique over the survivors of every input orders them.
+    round2 = [i for i, c in enumerate(candidates) if len(c) > 1]
+    order: List[List[int]] = [list(c) for c in candidates]
+    if round2:
+        calls = [
+            (
+                [instances[i][a] for a in candidates[i]],
+                complete_graph(len(candidates[i])),
+            )
+            for i in round2
+        ]
+        x, H, offsets = merge_calls(calls)
+        ranks = split_ranks(CompareAggregate(x, H), offsets)
+        for i, instance_ranks in zip(round2, ranks):
+            m = len(candidates[i])
+            by_rank = [0] * m
+            for a, r in zip(candidates[i], instance_ranks):
+                by_rank[r] = a
+            order[i] = by_rank[::-1] if largest else by_rank
+    return [o[:k] for o in order]
+
+
+def sorted_top_k_two_round_ca(
+    x: List[Any],
+    k: int,
+    CompareAggregate: CompareAggregateFn = compare_aggregate,
+    largest: bool = False,
+) -> List[Any]:
+    """
+    Exact sorted top-k in two CompareAggregate rounds.
+
+    Args:
+        x: A list of elements.
+        k: The number of top elements to find.
+        CompareAggregate: The Compare-Aggregate function to use.
+        largest: If False, return the k smallest elements in ascending order;
+            if True, the k largest in descending order.
+
+    Returns:
+        A sorted list of the top `k` elements.
+    """
+    (indices,) = batched_sorted_top_k_ca([x], k, CompareAggregate, largest)
+    return [x[i] for i in indices]
@@ -0,0 +1,95 @@
+"""
+Helpers shared by the Compare-Aggregate algorithms.
+
+Markers split an input into buckets: every element is compared with a few
+marker elements, and the number of markers below it is its bucket. The
+markers are elements of the input itself, given by their indices, and all
+comparisons use the strict order of `compare_aggregate` (by value, equal
+values by index). Appending value copies of the markers instead would put
+every element equal to a marker on the same side of it, so tie-heavy inputs
+would end up in one bucket.
+"""
+
+import random
+from typing import Any, List, Optional, Sequence, Tuple
+
+from compare_aggregate import complete_graph, CompareAggregateFn
+
+
+def sample_order(
+    x: List[Any],
+    size: int,
+    CompareAggregate: CompareAggregateFn,
+    rng: Optional[random.Random] = None,
+) -> List[int]:
+    """
+    Samples `size` indices of x (with `rng`, default: the `random` module)
+    and sorts them with one clique.
+
+    Returns:
+        The sampled indices, in ascending order of (value, index).
+    """
+    # Index order keeps ties broken as in a call over all of x.
+    S = sorted((rng or random).sample(range(len(x)), size))
+    ranks = CompareAggregate([x[i] for i in S], complete_graph(len(S)))
+    order = [0] * len(S)
+    for i, rank in zip(S, ranks):
+        order[rank] = i
+    return order
+
+
+def group_bounds(n: int, t: int) -> List[Tuple[int, int]]:
+    """Splits range(n) into t consecutive parts whose sizes differ by at most 1."""
+    q, r = divmod(n, t)
+    bounds = []
+    start = 0
+    for g in range(t):
+        end = start + q + (1 if g < r else 0)
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def marker_graph(n: int, markers: Sequence[int]) -> List[Tuple[int, int]]:
+    """
+    The graph that compares every vertex in range(n) with the marker
+    vertices `markers`: a biclique between the other vertices and the
+    markers, plus a clique on the markers, (n - m) * m + m(m - 1)/2 edges
+    for m markers.
+    """
+    is_marker = [False] * n
+    for j in markers:
+        is_marker[j] = True
+    H = [(i, j) for i in range(n) if not is_marker[i] for j in markers]
+    H.extend((a, b) for p, a in enumerate(markers) for b in markers[p + 1 :])
+    return H
+
+
+def marker_buckets(
+    ranks: Sequence[int], n: int, markers: Sequence[int]
+) -> List[List[int]]:
+    """
+    Splits range(n) into buckets from the ranks of a call on `marker_graph`.
+
+    Bucket b holds the vertices with exactly b markers below them, followed
+    by the b-th smallest marker. A non-marker's local rank is the number of
+    markers below it. A marker's local rank adds the non-markers below it,
+    which still grows with its position among the markers, so sorting the
+    markers by local rank orders them (see
+    `graph_optimizer.derive_subranking`).
+
+    Returns:
+        len(markers) + 1 buckets in ascending order, each holding its
+        vertices in ascending index order.
+    """
+    buckets: List[List[int]] = [[] for _ in range(len(markers) + 1)]
+    is_marker = [False] * n
+    for position, j in enumerate(sorted(markers, key=ranks.__getitem__)):
+        is_marker[j] = True
+        buckets[position].append(j)
+    for i in range(n):
+        if not is_marker[i]:
+            buckets[ranks[i]].append(i)
+    for bucket in buckets:
+        bucket.sort()
+    return buckets
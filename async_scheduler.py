@@ -0,0 +1,224 @@
+"""
+Asynchronous CompareAggregate backends and a round scheduler for them.
+
+In a deployment every CompareAggregate call is a network round trip. An
+async backend is a coroutine function with the CompareAggregate signature:
+
+    async def CompareAggregate(x, H) -> List[int]
+
+It may also offer `async def prepare(num_vertices, H)`, e.g. to request the
+FSS keys for a graph before the inputs are known. `to_async` turns any
+synchronous backend into an async one.
+
+`RoundScheduler` issues the calls of the async algorithms (such as
+`aav86_sort_ca_async` and `max_two_iteration_ca_async`). Independent calls
+passed to `RoundScheduler.gather` are in flight at the same time, and
+whatever the algorithm does between issuing a call and awaiting it (building
+the next graph, sampling pivots, `prepare`) overlaps with the round trip:
+
+    scheduler = RoundScheduler(to_async(compare_aggregate))
+    y = asyncio.run(aav86_sort_ca_async(x, 3, scheduler))
+    print(scheduler.report())
+
+With `coalesce=True`, the calls that concurrent branches issue in the same
+round are merged into one backend call, e.g. all partitions of one AAV86
+level. Like `CountingCompareAggregate`, the scheduler counts calls, edges and
+rounds. A call's round is one more than the round of the last call awaited
+before it on the same branch, tracked per asyncio task with a context
+variable.
+"""
+
+import asyncio
+import contextvars
+from concurrent.futures import Executor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from compare_aggregate import (
+    compare_aggregate,
+    merge_calls,
+    split_ranks,
+    CompareAggregateFn,
+)
+
+# Type alias for async CompareAggregate backends
+AsyncCompareAggregateFn = Callable[
+    [List[Any], List[Tuple[int, int]]], Awaitable[List[int]]
+]
+
+# Number of rounds the current branch has completed.
+_round: contextvars.ContextVar[int] = contextvars.ContextVar("ca_round", default=0)
+
+
+def to_async(
+    CompareAggregate: CompareAggregateFn = compare_aggregate,
+    executor: Optional[Executor] = None,
+) -> AsyncCompareAggregateFn:
+    """
+    Wraps a synchronous CompareAggregate backend as an async one.
+
+    Every call runs in `executor` (the event loop's default thread pool if
+    None), so that the event loop keeps building graphs meanwhile.
+    """
+
+    async def async_compare_aggregate(
+        x: List[Any], H: List[Tuple[int, int]]
+    ) -> List[int]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, CompareAggregate, x, H)
+
+    return async_compare_aggregate
+
+
+class RoundScheduler:
+    """
+    Issues CompareAggregate calls to an async backend and counts them.
+
+    Args:
+        backend: The async CompareAggregate backend. Defaults to
+            `to_async(compare_aggregate)`.
+        max_in_flight: Maximum number of concurrent calls, or None.
+        coalesce: If True, calls of the same round that are issued together
+            (e.g. by the branches of one `gather`) are merged into a single
+            backend call on the disjoint union of their graphs (see
+            `compare_aggregate.merge_calls`). Each graph is still `prepare`d
+            on its own.
+
+    Attributes:
+        calls, edges, rounds, fallbacks, log: As in `CountingCompareAggregate`.
+        backend_calls: Number of calls sent to the backend; fewer than
+            `calls` if calls were coalesced.
+        peak_in_flight: Largest number of backend calls in flight at once.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[AsyncCompareAggregateFn] = None,
+        max_in_flight: Optional[int] = None,
+        coalesce: bool = False,
+    ):
+        self.backend = backend if backend is not None else to_async()
+        self.coalesce = coalesce
+        self.calls = 0
+        self.backend_calls = 0
+        self.edges = 0
+        self.rounds = 0
+        self.fallbacks: Dict[str, int] = {}
+        self.log: List[Tuple[int, int, int]] = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._semaphore = (
+            asyncio.Semaphore(max_in_flight) if max_in_flight is not None else None
+        )
+        # Round -> calls waiting to be merged into one backend call.
+        self._pending: Dict[int, List[Tuple[List[Any], list, asyncio.Future]]] = {}
+        self._flushes: set = set()
+
+    def prepare(self, num_vertices: int, H: List[Tuple[int, int]]) -> asyncio.Future:
+        """
+        Starts the backend's `prepare` for the graph H, if it has one.
+
+        Returns:
+            A future to pass as `prepared` to the call that uses H.
+        """
+        prepare = getattr(self.backend, "prepare", None)
+        if prepare is None:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(None)
+            return future
+        return asyncio.ensure_future(prepare(num_vertices, H))
+
+    async def __call__(
+        self,
+        x: List[Any],
+        H: List[Tuple[int, int]],
+        prepared: Optional[Awaitable[Any]] = None,
+    ) -> List[int]:
+        round_index = _round.get()
+        self.calls += 1
+        self.edges += len(H)
+        self.rounds = max(self.rounds, round_index + 1)
+        self.log.append((round_index, len(x), len(H)))
+        if prepared is not None:
+            await prepared
+        if self.coalesce:
+            ranks = await self._enqueue(round_index, x, H)
+        else:
+            ranks = await self._issue(x, H)
+        _round.set(round_index + 1)
+        return ranks
+
+    def _enqueue(
+        self, round_index: int, x: List[Any], H: List[Tuple[int, int]]
+    ) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        batch = self._pending.get(round_index)
+        if batch is None:
+            batch = self._pending[round_index] = []
+            flush = asyncio.ensure_future(self._flush(round_index))
+            self._flushes.add(flush)
+            flush.add_done_callback(self._flushes.discard)
+        batch.append((x, H, future))
+        return future
+
+    async def _flush(self, round_index: int) -> None:
+        # Let the other branches that are ready to run issue their calls.
+        await asyncio.sleep(0)
+        batch = self._pending.pop(round_index)
+        x, H, offsets = merge_calls([(xi, Hi) for xi, Hi, _ in batch])
+        try:
+            ranks = await self._issue(x, H)
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, _, future), call_ranks in zip(batch, split_ranks(ranks, offsets)):
+            future.set_result(call_ranks)
+
+    async def _issue(self, x: List[Any], H: List[Tuple[int, int]]) -> List[int]:
+        if self._semaphore is not None:
+            async with self._semaphore:
+                return await self._send(x, H)
+        return await self._send(x, H)
+
+    async def _send(self, x: List[Any], H: List[Tuple[int, int]]) -> List[int]:
+        self.backend_calls += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            return await self.backend(x, H)
+        finally:
+            self.in_flight -= 1
+
+    async def gather(self, *branches: Awaitable[Any]) -> List[Any]:
+        """
+        Runs independent branches (coroutines) concurrently.
+
+        Every branch starts in the current round; the caller continues after
+        the longest one, as with `ca_parallel`/`ca_branch`.
+
+        Returns:
+            The branches' results, in order.
+        """
+        start = _round.get()
+
+        async def branch(aw: Awaitable[Any]) -> Tuple[Any, int]:
+            result = await aw
+            return result, _round.get()
+
+        outcomes = await asyncio.gather(*(branch(aw) for aw in branches))
+        _round.set(max([start] + [end for _, end in outcomes]))
+        return [result for result, _ in outcomes]
+
+    def record_fallback(self, reason: str) -> None:
+        self.fallbacks[reason] = self.fallbacks.get(reason, 0) + 1
+
+    def report(self) -> Dict[str, Any]:
+        """Returns the counters as a dictionary."""
+        return {
+            "calls": self.calls,
+            "edges": self.edges,
+            "rounds": self.rounds,
+            "fallbacks": dict(self.fallbacks),
+            "backend_calls": self.backend_calls,
+            "peak_in_flight": self.peak_in_flight,
+        }
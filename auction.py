@@ -0,0 +1,85 @@
+"""
+Batched sealed-bid (k+1)-th price auctions on top of the Compare-Aggregate
+top-k.
+
+Every auction is a list of `(bidder_id, bid)` pairs. The k highest bids win,
+and every winner pays the (k+1)-th highest bid (the Vickrey auction for
+k = 1), or the reserve price if there are at most k bids. All auctions are
+ranked together with `batched_sorted_top_k_ca`, so a whole batch costs two
+CompareAggregate rounds, however many auctions it holds:
+
+    results, report = run_auctions(auctions, k=1)
+"""
+
+import time
+from typing import Any, Dict, List, Tuple
+
+from algorithms.top_k import batched_sorted_top_k_ca, top_k_edges, top_k_rounds
+from compare_aggregate import (
+    compare_aggregate,
+    CompareAggregateFn,
+    CountingCompareAggregate,
+)
+
+Bid = Tuple[Any, Any]
+
+
+def run_auctions(
+    auctions: List[List[Bid]],
+    k: int = 1,
+    CompareAggregate: CompareAggregateFn = compare_aggregate,
+    reserve: Any = 0,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Runs many independent (k+1)-th price auctions in shared CA rounds.
+
+    Ties between equal bids are resolved in favor of the earlier bid.
+
+    Args:
+        auctions: A list of auctions, each a list of `(bidder_id, bid)` pairs.
+        k: The number of items sold per auction.
+        CompareAggregate: The Compare-Aggregate function to use.
+        reserve: The price paid if an auction has at most k bids.
+
+    Returns:
+        A tuple `(results, report)`. `results` holds one dictionary per
+        auction with the `winners` (bidder ids, highest bid first), their
+        `winning_bids`, the clearing `price` and the CA `rounds` and `edges`
+        the auction needs on its own. `report` holds the total `calls`,
+        `rounds` and `edges` of the batch, the `max_rounds_per_auction`, the
+        `mean_edges_per_auction`, the wall time in `seconds` and the
+        throughput in `auctions_per_second`.
+    """
+    if k < 1:
+        raise ValueError("k must be at least 1")
+    counter = CountingCompareAggregate(CompareAggregate)
+    start = time.perf_counter()
+    # compare_aggregate ranks the later of two equal values higher; reversing
+    # the bids makes earlier bids win ties.
+    bids = [[bid for _, bid in reversed(auction)] for auction in auctions]
+    top = batched_sorted_top_k_ca(bids, k + 1, counter, largest=True)
+    results = []
+    for auction, indices in zip(auctions, top):
+        ranked = [auction[len(auction) - 1 - i] for i in indices]
+        winners = ranked[:k]
+        results.append(
+            {
+                "winners": [bidder for bidder, _ in winners],
+                "winning_bids": [bid for _, bid in winners],
+                "price": ranked[k][1] if len(ranked) > k else reserve,
+                "rounds": top_k_rounds(len(auction), k + 1),
+                "edges": top_k_edges(len(auction), k + 1),
+            }
+        )
+    seconds = time.perf_counter() - start
+
+    report = counter.report()
+    report["max_rounds_per_auction"] = max(
+        (result["rounds"] for result in results), default=0
+    )
+    report["mean_edges_per_auction"] = (
+        sum(result["edges"] for result in results) / len(results) if results else 0.0
+    )
+    report["seconds"] = seconds
+    report["auctions_per_second"] = len(auctions) / seconds if seconds > 0 else 0.0
+    return results, report
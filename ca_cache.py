@@ -0,0 +1,321 @@
+"""
+Result caching for repeated ranking queries on an unchanged dataset.
+
+A service that answers top-k, median and percentile queries on the same data
+again and again need not pay for the same CompareAggregate work every time.
+Two layers reuse it, both keyed by the dataset version:
+
+- `CachingCompareAggregate` wraps a backend and returns the cached local
+  ranks of a call it has seen before (same dataset version, same input, same
+  graph). This helps deterministic algorithms such as `sorted_top_k_CA` and
+  `batched_sorted_top_k_ca`.
+- `CachedRanker` sorts the dataset once with `aav86_sort_ca` and answers
+  every later select, top-k, median and percentile query from the cached
+  ordering, without any CompareAggregate call:
+
+    data = VersionedDataset(values)
+    ranker = CachedRanker(data)
+    ranker.median()          # sorts: 3 rounds
+    ranker.percentile(0.99)  # cached: 0 rounds
+    data[17] = 42            # new version, the ordering is recomputed
+    ranker.top_k(10)
+
+Every mutation of a `VersionedDataset` gives it a new version, so cached
+results of earlier versions are never returned. Both layers store their
+entries in an `LRUCache` bounded by bytes, which can be shared between them
+and reports hits, misses, evictions and invalidations.
+"""
+
+import hashlib
+import itertools
+import math
+import pickle
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+from algorithms.aav86 import aav86_sort_ca
+from compare_aggregate import (
+    ca_branch,
+    ca_fallback,
+    ca_parallel,
+    compare_aggregate,
+    CompareAggregateFn,
+)
+
+# Versions are unique across datasets, so one cache can serve several.
+_versions = itertools.count()
+
+
+class VersionedDataset:
+    """
+    A list of values whose `version` changes on every mutation.
+
+    Supports reading like a list (indexing, `len`, iteration) and the
+    mutations `__setitem__`, `__delitem__`, `append`, `extend` and `replace`.
+    """
+
+    def __init__(self, values: Iterable[Any] = ()):
+        self._values = list(values)
+        self.version = next(_versions)
+
+    def _mutated(self) -> None:
+        self.version = next(_versions)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __getitem__(self, index):
+        return self._values[index]
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._values)
+
+    def __setitem__(self, index, value) -> None:
+        self._values[index] = value
+        self._mutated()
+
+    def __delitem__(self, index) -> None:
+        del self._values[index]
+        self._mutated()
+
+    def append(self, value: Any) -> None:
+        self._values.append(value)
+        self._mutated()
+
+    def extend(self, values: Iterable[Any]) -> None:
+        self._values.extend(values)
+        self._mutated()
+
+    def replace(self, values: Iterable[Any]) -> None:
+        """Replaces all values, e.g. with a new snapshot."""
+        self._values = list(values)
+        self._mutated()
+
+    def snapshot(self) -> List[Any]:
+        """A copy of the current values."""
+        return list(self._values)
+
+
+class LRUCache:
+    """
+    A least-recently-used cache of int32 arrays, bounded by their total size.
+
+    Keys are tuples whose first element is a dataset version.
+
+    Args:
+        max_bytes: Upper bound on the total size of the cached arrays.
+
+    Attributes:
+        hits, misses: Number of lookups that found / did not find a value.
+        evictions: Number of entries dropped to stay within `max_bytes`.
+        invalidations: Number of entries dropped because their version
+            became stale.
+        nbytes: Total size of the cached arrays.
+    """
+
+    def __init__(self, max_bytes: int = 64 << 20):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.nbytes = 0
+        self._entries: "OrderedDict[Hashable, array]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[array]:
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: array) -> None:
+        size = len(value) * value.itemsize
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.nbytes -= len(old) * old.itemsize
+        self._entries[key] = value
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.nbytes -= len(evicted) * evicted.itemsize
+            self.evictions += 1
+
+    def invalidate(self, version: int) -> None:
+        """Drops every entry of `version`."""
+        for key in [key for key in self._entries if key[0] == version]:
+            value = self._entries.pop(key)
+            self.nbytes -= len(value) * value.itemsize
+            self.invalidations += 1
+
+    def report(self) -> Dict[str, Any]:
+        """Returns the counters as a dictionary."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "bytes": self.nbytes,
+        }
+
+
+def _digest(obj: Any) -> bytes:
+    return hashlib.blake2b(
+        pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL), digest_size=16
+    ).digest()
+
+
+class _VersionTracker:
+    """Drops a dataset's entries from the cache once its version changes."""
+
+    def __init__(self, dataset: VersionedDataset, cache: LRUCache):
+        self.dataset = dataset
+        self.cache = cache
+        self._version = dataset.version
+
+    def current_version(self) -> int:
+        if self.dataset.version != self._version:
+            self.cache.invalidate(self._version)
+            self._version = self.dataset.version
+        return self._version
+
+
+class CachingCompareAggregate(_VersionTracker):
+    """
+    A CompareAggregate wrapper that caches local ranks per dataset version.
+
+    A call is answered from the cache if a call with the same input and the
+    same graph was made on the same version of `dataset`. The input is part
+    of the key because algorithms call CompareAggregate on samples and
+    partitions of the dataset, not only on the dataset itself. Rounds are
+    tracked by the wrapped CompareAggregate (e.g. a
+    `CountingCompareAggregate`), which only sees the calls that miss.
+
+    Args:
+        dataset: The dataset the calls are derived from.
+        CompareAggregate: The backend to forward misses to.
+        cache: The cache to use; a new `LRUCache(max_bytes)` if None.
+        max_bytes: Size bound of a new cache.
+    """
+
+    def __init__(
+        self,
+        dataset: VersionedDataset,
+        CompareAggregate: CompareAggregateFn = compare_aggregate,
+        cache: Optional[LRUCache] = None,
+        max_bytes: int = 64 << 20,
+    ):
+        super().__init__(dataset, cache if cache is not None else LRUCache(max_bytes))
+        self.CompareAggregate = CompareAggregate
+
+    def __call__(self, x: List[Any], H: List[Tuple[int, int]]) -> List[int]:
+        key = (self.current_version(), "ranks", _digest(x), _digest(H))
+        ranks = self.cache.get(key)
+        if ranks is not None:
+            return ranks.tolist()
+        result = self.CompareAggregate(x, H)
+        self.cache.put(key, array("i", result))
+        return result
+
+    def parallel(self):
+        return ca_parallel(self.CompareAggregate)
+
+    def branch(self):
+        return ca_branch(self.CompareAggregate)
+
+    def record_fallback(self, reason: str) -> None:
+        ca_fallback(self.CompareAggregate, reason)
+
+    def report(self) -> Dict[str, Any]:
+        return self.cache.report()
+
+
+class CachedRanker(_VersionTracker):
+    """
+    Answers ranking queries on a dataset from one cached full ordering.
+
+    The ordering (the dataset's indices by value, ties by index) is computed
+    with `aav86_sort_ca` on `(value, index)` pairs the first time a version is
+    queried and reused until the dataset changes or the entry is evicted.
+
+    Args:
+        dataset: The dataset to rank.
+        CompareAggregate: The Compare-Aggregate function used for sorting.
+        cache: The cache to use; a new `LRUCache(max_bytes)` if None.
+        max_bytes: Size bound of a new cache.
+        iterations: AAV86 iterations of the sort.
+    """
+
+    def __init__(
+        self,
+        dataset: VersionedDataset,
+        CompareAggregate: CompareAggregateFn = compare_aggregate,
+        cache: Optional[LRUCache] = None,
+        max_bytes: int = 64 << 20,
+        iterations: int = 3,
+    ):
+        super().__init__(dataset, cache if cache is not None else LRUCache(max_bytes))
+        self.CompareAggregate = CompareAggregate
+        self.iterations = iterations
+
+    def ordering(self) -> array:
+        """The dataset's indices in ascending order of value."""
+        key = (self.current_version(), "ordering")
+        order = self.cache.get(key)
+        if order is None:
+            pairs = [(v, i) for i, v in enumerate(self.dataset)]
+            order = array(
+                "i",
+                (
+                    i
+                    for _, i in aav86_sort_ca(
+                        pairs, self.iterations, self.CompareAggregate
+                    )
+                ),
+            )
+            self.cache.put(key, order)
+        return order
+
+    def select(self, rank: int) -> Any:
+        """The element of the given rank (0-based, ascending)."""
+        n = len(self.dataset)
+        if not 0 <= rank < n:
+            raise IndexError(f"rank {rank} out of range for {n} elements")
+        return self.dataset[self.ordering()[rank]]
+
+    def top_k(self, k: int, largest: bool = False) -> List[Any]:
+        """The k smallest (or largest) elements, in order."""
+        order = self.ordering()
+        k = max(0, min(k, len(order)))
+        indices = order[:k] if not largest else reversed(order[len(order) - k :])
+        return [self.dataset[i] for i in indices]
+
+    def median(self) -> Any:
+        """
+        The median (the element of rank n // 2, as in `median_BB90_4iter_CA`),
+        or None if the dataset is empty.
+        """
+        n = len(self.dataset)
+        return self.select(n // 2) if n else None
+
+    def percentile(self, q: float) -> Any:
+        """
+        The q-quantile (0 <= q <= 1): the element of rank floor(q * n),
+        capped at n - 1, as in `quantiles_ca`. None if the dataset is empty.
+        """
+        n = len(self.dataset)
+        return self.select(min(n - 1, math.floor(q * n))) if n else None
+
+    def report(self) -> Dict[str, Any]:
+        return self.cache.report()
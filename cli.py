@@ -0,0 +1,327 @@
+"""
+Command-line entry point for bulk sorting, selection and top-k over files.
+
+Run as `python -m compare_aggregate <task> <input> [options]`, e.g.
+
+    python -m compare_aggregate sort data.npy -o sorted.npy --report
+    python -m compare_aggregate select data.bin --dtype int32 --rank 1000
+    python -m compare_aggregate quantiles data.txt --quantiles 0.5 0.9 0.99
+    python -m compare_aggregate top-k data.txt --k 10 -o top.txt
+
+Inputs are read in chunks from newline-delimited text, raw binary (native
+byte order, `--dtype`, default int64) or NumPy `.npy` files (memory-mapped,
+needs numpy). Text values are parsed as integers, or as floats if they are
+not. Results are written in the same formats with buffered bulk writes, in
+the input's dtype (int64 or float64 for text) unless `--dtype` is given.
+Scalar results (select, max, median) are written as a single value,
+quantiles as one value per quantile. Empty inputs are rejected. `--report`
+prints the CompareAggregate round/edge counts and the timings to stderr.
+"""
+
+import argparse
+import sys
+import time
+from array import array
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from algorithms.aav86 import aav86_sort_ca
+from algorithms.maximum import max_two_iteration_ca
+from algorithms.misc import median_BB90_4iter_CA
+from algorithms.selection import multi_select_ca, quantiles_ca
+from algorithms.top_k import sorted_top_k_two_round_ca
+from compare_aggregate import (
+    compare_aggregate,
+    CompareAggregateFn,
+    CountingCompareAggregate,
+)
+
+# Number of values read or written per chunk.
+CHUNK_SIZE = 1 << 16
+
+# dtype name -> array typecode for raw binary input/output.
+DTYPES = {
+    "int8": "b",
+    "uint8": "B",
+    "int16": "h",
+    "uint16": "H",
+    "int32": "i",
+    "uint32": "I",
+    "int64": "q",
+    "uint64": "Q",
+    "float32": "f",
+    "float64": "d",
+}
+
+BACKENDS: Dict[str, CompareAggregateFn] = {
+    "cleartext": compare_aggregate,
+}
+try:
+    from backends import SimulatedTwoPartyCompareAggregate, vectorized_compare_aggregate
+except ImportError:  # numpy is not installed
+    pass
+else:
+    BACKENDS["vectorized"] = vectorized_compare_aggregate
+    BACKENDS["two-party"] = SimulatedTwoPartyCompareAggregate()
+
+
+def _check_two_party_input(x: Sequence[Any]) -> None:
+    """Rejects the inputs `SimulatedTwoPartyCompareAggregate` cannot share."""
+    if any(isinstance(v, float) for v in x):
+        raise SystemExit("the two-party backend only supports integer input")
+    if x and not -(2**62) <= min(x) <= max(x) < 2**62:
+        raise SystemExit("the two-party backend needs values in [-2^62, 2^62)")
+
+
+def _run_sort(x, args, ca):
+    return aav86_sort_ca(x, args.iterations, ca)
+
+
+def _run_select(x, args, ca):
+    if not 0 <= args.rank < len(x):
+        raise SystemExit(f"--rank {args.rank} out of range for {len(x)} values")
+    return multi_select_ca(x, [args.rank], ca)[0]
+
+
+def _run_top_k(x, args, ca):
+    if args.k < 0:
+        raise SystemExit("--k must not be negative")
+    return sorted_top_k_two_round_ca(x, args.k, ca)
+
+
+def _run_quantiles(x, args, ca):
+    if any(not 0 <= q <= 1 for q in args.quantiles):
+        raise SystemExit("--quantiles must lie in [0, 1]")
+    return quantiles_ca(x, args.quantiles, ca)
+
+
+def _run_max(x, args, ca):
+    return max_two_iteration_ca(x, ca)
+
+
+def _run_median(x, args, ca):
+    return median_BB90_4iter_CA(x, ca)
+
+
+# Task name -> function(x, args, CompareAggregate) returning a list or a value.
+TaskFn = Callable[[List[Any], argparse.Namespace, CompareAggregateFn], Any]
+TASKS: Dict[str, TaskFn] = {
+    "sort": _run_sort,
+    "select": _run_select,
+    "top-k": _run_top_k,
+    "max": _run_max,
+    "median": _run_median,
+    "quantiles": _run_quantiles,
+}
+
+
+def _detect_format(path: str, given: Optional[str]) -> str:
+    if given:
+        return given
+    if path.endswith(".npy"):
+        return "npy"
+    if path.endswith((".bin", ".raw")):
+        return "binary"
+    return "text"
+
+
+def _open(path: str, mode: str, std):
+    """Opens `path` with a large buffer, or returns `std` (unclosed) for "-"."""
+    if path == "-":
+        return nullcontext(std)
+    return open(path, mode, buffering=1 << 20)
+
+
+def _parse_number(text: str) -> Any:
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def input_dtype(
+    path: str, fmt: str, dtype: Optional[str], values: Sequence[Any]
+) -> str:
+    """
+    The dtype of the values read from `path`: `dtype` if given, else the
+    dtype of a `.npy` file, int64 for binary files and int64 or float64 for
+    text (float64 if any value is a float).
+    """
+    if dtype is not None:
+        return dtype
+    if fmt == "npy":
+        import numpy as np
+
+        return np.load(path, mmap_mode="r").dtype.name
+    if fmt == "text" and any(isinstance(v, float) for v in values):
+        return "float64"
+    return "int64"
+
+
+def iter_chunks(
+    path: str, fmt: str, dtype: Optional[str] = None
+) -> Iterator[Sequence[Any]]:
+    """
+    Yields the values stored in `path` in chunks of up to CHUNK_SIZE.
+
+    Raises:
+        SystemExit: If a text value is not a number or the size of a binary
+            file is not a multiple of the item size.
+    """
+    if fmt == "npy":
+        import numpy as np
+
+        data = np.load(path, mmap_mode="r")
+        flat = data.reshape(-1)
+        for start in range(0, len(flat), CHUNK_SIZE):
+            yield flat[start : start + CHUNK_SIZE].tolist()
+    elif fmt == "binary":
+        dtype = dtype or "int64"
+        typecode = DTYPES[dtype]
+        itemsize = array(typecode).itemsize
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(CHUNK_SIZE * itemsize)
+                if not data:
+                    break
+                if len(data) % itemsize:
+                    raise SystemExit(
+                        f"{path}: size is not a multiple of the {dtype} item "
+                        f"size ({itemsize} bytes)"
+                    )
+                chunk = array(typecode)
+                chunk.frombytes(data)
+                yield chunk
+    else:
+        if dtype is None:
+            parse = _parse_number
+        else:
+            parse = float if dtype.startswith("float") else int
+        with _open(path, "r", sys.stdin) as f:
+            chunk = []
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if line:
+                    try:
+                        chunk.append(parse(line))
+                    except ValueError:
+                        raise SystemExit(
+                            f"{path}:{line_number}: {line!r} is not a valid "
+                            f"{dtype or 'number'}"
+                        ) from None
+                    if len(chunk) == CHUNK_SIZE:
+                        yield chunk
+                        chunk = []
+            if chunk:
+                yield chunk
+
+
+def read_values(path: str, fmt: str, dtype: Optional[str] = None) -> List[Any]:
+    """Reads all values in `path` into a list."""
+    values: List[Any] = []
+    for chunk in iter_chunks(path, fmt, dtype):
+        values.extend(chunk)
+    return values
+
+
+def write_values(path: str, fmt: str, dtype: str, values: Sequence[Any]) -> None:
+    """Writes `values` to `path` ("-" for stdout) in bulk chunks."""
+    if fmt == "npy":
+        import numpy as np
+
+        np.save(path, np.asarray(values, dtype=dtype))
+    elif fmt == "binary":
+        typecode = DTYPES[dtype]
+        with _open(path, "wb", sys.stdout.buffer) as f:
+            for start in range(0, len(values), CHUNK_SIZE):
+                array(typecode, values[start : start + CHUNK_SIZE]).tofile(f)
+    else:
+        with _open(path, "wb", sys.stdout.buffer) as f:
+            for start in range(0, len(values), CHUNK_SIZE):
+                chunk = values[start : start + CHUNK_SIZE]
+                f.write(("\n".join(map(str, chunk)) + "\n").encode())
+            f.flush()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m compare_aggregate",
+        description="Sort, select, top-k, max, median or quantiles over a file "
+        "of values, using the Compare-Aggregate algorithms.",
+    )
+    parser.add_argument("task", choices=sorted(TASKS))
+    parser.add_argument("input", help='input file, or "-" for text on stdin')
+    parser.add_argument(
+        "-o", "--output", default="-", help="output file (default: stdout)"
+    )
+    parser.add_argument("--input-format", choices=["text", "binary", "npy"])
+    parser.add_argument("--output-format", choices=["text", "binary", "npy"])
+    parser.add_argument(
+        "--dtype",
+        choices=sorted(DTYPES),
+        help="value type of binary input and of the output "
+        "(default: the input's dtype; int64 for binary input)",
+    )
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="cleartext")
+    parser.add_argument("--k", type=int, default=10, help="top-k: number of values")
+    parser.add_argument("--rank", type=int, default=0, help="select: rank (0-based)")
+    parser.add_argument(
+        "--quantiles",
+        type=float,
+        nargs="+",
+        default=[0.5, 0.9, 0.99, 0.999],
+        help="quantiles: the quantiles to select",
+    )
+    parser.add_argument(
+        "--iterations",
+        type=int,
+        default=3,
+        help="AAV86 iterations for sort",
+    )
+    parser.add_argument(
+        "--report",
+        action="store_true",
+        help="print rounds, edges and timings to stderr",
+    )
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    input_format = _detect_format(args.input, args.input_format)
+    output_format = args.output_format or (
+        _detect_format(args.output, None) if args.output != "-" else "text"
+    )
+
+    start = time.perf_counter()
+    x = read_values(args.input, input_format, args.dtype)
+    if not x:
+        raise SystemExit(f"{args.input}: no input values")
+    dtype = input_dtype(args.input, input_format, args.dtype, x)
+    if args.backend == "two-party":
+        _check_two_party_input(x)
+    read_done = time.perf_counter()
+
+    ca = CountingCompareAggregate(BACKENDS[args.backend])
+    result = TASKS[args.task](x, args, ca)
+    compute_done = time.perf_counter()
+
+    write_values(
+        args.output,
+        output_format,
+        dtype,
+        result if isinstance(result, list) else [result],
+    )
+    write_done = time.perf_counter()
+
+    if args.report:
+        report = ca.report()
+        print(
+            f"task={args.task} n={len(x)} backend={args.backend} "
+            f"calls={report['calls']} rounds={report['rounds']} "
+            f"edges={report['edges']} fallbacks={report['fallbacks']}\n"
+            f"read={read_done - start:.3f}s compute={compute_done - read_done:.3f}s "
+            f"write={write_done - compute_done:.3f}s",
+            file=sys.stderr,
+        )
+    return 0
@@ -13,10 +13,13 @@ This module provides a trivial, cleartext version of this function,
 `CompareAggregate_trivial`, for demonstration and testing purposes.
 """
 
-from typing import Any, Callable, List, Tuple
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, List, Tuple
 
 # Type alias for the CompareAggregate function
 CompareAggregateFn = Callable[[List[Any], List[Tuple[int, int]]], List[int]]
+# Type alias for the Compare function of Valiant's model (see `compare_direct`)
+CompareFn = Callable[[List[Any], List[Tuple[int, int]]], Dict[Tuple[int, int], int]]
 
 
 def compare_direct(x: list, H: list[tuple[int, int]]) -> dict[tuple[int, int], int]:
@@ -68,3 +71,236 @@ def complete_graph(n: int) -> List[Tuple[int, int]]:
         A list of tuples, where each tuple is an edge (i, j) with i < j.
     """
     return [(i, j) for i in range(n) for j in range(i + 1, n)]
+
+
+def ranks_from_comparisons(n: int, results: dict[tuple[int, int], int]) -> List[int]:
+    """
+    Turns the per-edge results of `compare_direct` into local ranks. For
+    edges (i, j) with i < j, these equal the local ranks `compare_aggregate`
+    returns for the same graph (ties go to the larger index).
+    """
+    ranks = [0] * n
+    for (i, j), c in results.items():
+        if c == 1:
+            ranks[i] += 1
+        else:
+            ranks[j] += 1
+    return ranks
+
+
+def select_kth(x: List[Any], k: int) -> Any:
+    """
+    Selects the k-th smallest element (0-based) in Valiant's model, using one
+    round of all pairwise comparisons.
+
+    Ties are broken by the original index, as in `compare_aggregate`.
+
+    Args:
+        x: A list of elements.
+        k: The desired rank (0-based).
+
+    Returns:
+        The k-th smallest element, or None if `x` is empty.
+    """
+    n = len(x)
+    if n == 0:
+        return None
+    if not 0 <= k < n:
+        raise IndexError(f"k={k} out of range for {n} elements")
+    ranks = ranks_from_comparisons(n, compare_direct(x, complete_graph(n)))
+    return x[ranks.index(k)]
+
+
+def select_kth_CA(
+    x: List[Any], k: int, CompareAggregate: CompareAggregateFn = compare_aggregate
+) -> Any:
+    """
+    Selects the k-th smallest element (0-based) with a single
+    CompareAggregate call over a clique.
+
+    Args:
+        x: A list of elements.
+        k: The desired rank (0-based).
+        CompareAggregate: The Compare-Aggregate function to use.
+
+    Returns:
+        The k-th smallest element, or None if `x` is empty.
+    """
+    n = len(x)
+    if n == 0:
+        return None
+    if not 0 <= k < n:
+        raise IndexError(f"k={k} out of range for {n} elements")
+    ranks = CompareAggregate(x, complete_graph(n))
+    return x[ranks.index(k)]
+
+
+def sorted_top_k(x: List[Any], k: int) -> List[Any]:
+    """
+    Returns the `k` smallest elements of `x` in ascending order, using one
+    round of all pairwise comparisons (Valiant's model).
+    """
+    n = len(x)
+    ranks = ranks_from_comparisons(n, compare_direct(x, complete_graph(n)))
+    y = [None] * min(k, n)
+    for i, rank in enumerate(ranks):
+        if rank < k:
+            y[rank] = x[i]
+    return y
+
+
+def sorted_top_k_CA(
+    x: List[Any], k: int, CompareAggregate: CompareAggregateFn = compare_aggregate
+) -> List[Any]:
+    """
+    Returns the `k` smallest elements of `x` in ascending order, using a
+    single CompareAggregate call over a clique.
+    """
+    n = len(x)
+    if n == 0:
+        return []
+    ranks = CompareAggregate(x, complete_graph(n))
+    y = [None] * min(k, n)
+    for i, rank in enumerate(ranks):
+        if rank < k:
+            y[rank] = x[i]
+    return y
+
+
+def merge_calls(
+    calls: List[Tuple[List[Any], List[Tuple[int, int]]]],
+) -> Tuple[List[Any], List[Tuple[int, int]], List[int]]:
+    """
+    Merges independent CompareAggregate calls into a single call.
+
+    The inputs are concatenated and every graph is shifted to its input's
+    position, so the merged graph is the disjoint union of the graphs and
+    the local ranks are unchanged.
+
+    Args:
+        calls: A list of `(x, H)` pairs.
+
+    Returns:
+        The merged input, the merged graph, and the offset of every call's
+        input (followed by the total length), for use with `split_ranks`.
+    """
+    x: List[Any] = []
+    H: List[Tuple[int, int]] = []
+    offsets = [0]
+    for xi, Hi in calls:
+        offset = len(x)
+        x.extend(xi)
+        H.extend((i + offset, j + offset) for i, j in Hi)
+        offsets.append(len(x))
+    return x, H, offsets
+
+
+def split_ranks(ranks: List[int], offsets: List[int]) -> List[List[int]]:
+    """Splits the local ranks of a merged call back into per-call ranks."""
+    return [ranks[offsets[c] : offsets[c + 1]] for c in range(len(offsets) - 1)]
+
+
+class CountingCompareAggregate:
+    """
+    Wraps a CompareAggregate function and counts calls, edges and rounds.
+
+    Pass an instance wherever an algorithm takes a `CompareAggregate`
+    argument. A call is placed one round after the previous call; algorithms
+    that issue calls which do not depend on each other wrap them in
+    `ca_parallel` and `ca_branch` so that they share a round. Algorithms report
+    probabilistic failures they recover from with `ca_fallback`.
+
+    Attributes:
+        calls: Number of CompareAggregate calls.
+        edges: Total number of edges over all calls.
+        rounds: Number of sequential rounds (length of the longest chain of
+            dependent calls).
+        fallbacks: Number of fallbacks taken, by reason.
+        log: One `(round, vertices, edges)` entry per call, in call order.
+    """
+
+    def __init__(self, CompareAggregate: CompareAggregateFn = compare_aggregate):
+        self.CompareAggregate = CompareAggregate
+        self.calls = 0
+        self.edges = 0
+        self.rounds = 0
+        self.fallbacks: Dict[str, int] = {}
+        self.log: List[Tuple[int, int, int]] = []
+        self._round = 0
+        self._parallel: List[Tuple[int, List[int]]] = []
+
+    def __call__(self, x: List[Any], H: List[Tuple[int, int]]) -> List[int]:
+        round_index = self._round
+        self._round += 1
+        self.rounds = max(self.rounds, self._round)
+        self.calls += 1
+        self.edges += len(H)
+        self.log.append((round_index, len(x), len(H)))
+        return self.CompareAggregate(x, H)
+
+    @contextmanager
+    def parallel(self):
+        """Groups the `branch` blocks inside it into the same round(s)."""
+        ends = [self._round]
+        self._parallel.append((self._round, ends))
+        try:
+            yield
+        finally:
+            self._parallel.pop()
+            self._round = max(ends)
+
+    @contextmanager
+    def branch(self):
+        """Calls in this block do not depend on earlier sibling branches."""
+        if not self._parallel:
+            yield
+            return
+        start, ends = self._parallel[-1]
+        self._round = start
+        try:
+            yield
+        finally:
+            ends.append(self._round)
+
+    def record_fallback(self, reason: str) -> None:
+        self.fallbacks[reason] = self.fallbacks.get(reason, 0) + 1
+
+    def report(self) -> Dict[str, Any]:
+        """Returns the counters as a dictionary."""
+        return {
+            "calls": self.calls,
+            "edges": self.edges,
+            "rounds": self.rounds,
+            "fallbacks": dict(self.fallbacks),
+        }
+
+
+def ca_parallel(CompareAggregate: CompareAggregateFn):
+    """
+    Context manager marking a group of independent `ca_branch` blocks.
+
+    A no-op unless `CompareAggregate` tracks rounds (see
+    `CountingCompareAggregate`).
+    """
+    parallel = getattr(CompareAggregate, "parallel", None)
+    return parallel() if parallel is not None else nullcontext()
+
+
+def ca_branch(CompareAggregate: CompareAggregateFn):
+    """Context manager marking one independent branch inside `ca_parallel`."""
+    branch = getattr(CompareAggregate, "branch", None)
+    return branch() if branch is not None else nullcontext()
+
+
+def ca_fallback(CompareAggregate: CompareAggregateFn, reason: str) -> None:
+    """Records that an algorithm fell back to a slower path because of `reason`."""
+    record_fallback = getattr(CompareAggregate, "record_fallback", None)
+    if record_fallback is not None:
+        record_fallback(reason)
+
+
+if __name__ == "__main__":
+    # `python -m compare_aggregate ...`: bulk sort/select/top-k over files.
+    from cli import main
+
+    raise SystemExit(main())
@@ -0,0 +1,174 @@
+"""
+Composite (multi-column) sort keys packed into single integers.
+
+A ranking by several columns, e.g. price descending, then timestamp
+ascending, then bidder id, becomes a ranking of plain integers: every column
+is shifted to start at 0 (and flipped if descending) and the columns are
+concatenated bitwise, most significant first. The row index goes into the
+lowest bits, so that keys are unique and every key identifies its row. A
+single CompareAggregate call then compares the whole composite key, with any
+backend and any of the sort, selection and top-k algorithms:
+
+    keys, layout = pack_keys([prices, timestamps, bidders], [True, False, False])
+    order = composite_sort_ca([prices, timestamps, bidders], [True, False, False])
+
+Columns must hold integers; scale and round fixed-point values first. For a
+fixed key width across batches, pass the column `bounds` instead of deriving
+them from the data. (`backends.lexicographic_compare_aggregate` compares
+unpacked rows column by column instead.)
+"""
+
+from typing import List, Optional, Sequence, Tuple
+
+from algorithms.aav86 import aav86_sort_ca
+from algorithms.top_k import sorted_top_k_two_round_ca
+from compare_aggregate import compare_aggregate, CompareAggregateFn
+
+
+class KeyLayout:
+    """
+    The bit layout of packed keys: per column its inclusive `(low, high)`
+    bounds, bit width and direction, and the number of low bits holding the
+    row index.
+    """
+
+    __slots__ = ("bounds", "widths", "descending", "index_bits")
+
+    def __init__(
+        self,
+        bounds: List[Tuple[int, int]],
+        descending: List[bool],
+        index_bits: int,
+    ):
+        self.bounds = bounds
+        self.widths = [(high - low).bit_length() for low, high in bounds]
+        self.descending = descending
+        self.index_bits = index_bits
+
+    @property
+    def bits(self) -> int:
+        """Total width of a packed key."""
+        return sum(self.widths) + self.index_bits
+
+    def __repr__(self) -> str:
+        return (
+            f"KeyLayout(bounds={self.bounds}, descending={self.descending}, "
+            f"index_bits={self.index_bits})"
+        )
+
+
+def pack_keys(
+    columns: Sequence[Sequence[int]],
+    descending: Optional[Sequence[bool]] = None,
+    bounds: Optional[Sequence[Tuple[int, int]]] = None,
+    with_index: bool = True,
+    max_bits: Optional[int] = None,
+) -> Tuple[List[int], KeyLayout]:
+    """
+    Packs rows of integer columns into integers ordered lexicographically.
+
+    Args:
+        columns: The key columns, most significant first, all of equal length.
+        descending: Per-column direction flags (default: all ascending).
+        bounds: Per-column inclusive `(low, high)` bounds. Derived from the
+            data if None.
+        with_index: If True, append the row index as the least significant
+            part, which makes the keys unique and lets `unpack_keys` return
+            the rows.
+        max_bits: Raise a ValueError if the keys would be wider, e.g. 64 for
+            a backend working on 64-bit integers.
+
+    Returns:
+        The packed keys and their `KeyLayout`.
+    """
+    if not columns:
+        raise ValueError("need at least one key column")
+    n = len(columns[0])
+    if any(len(column) != n for column in columns):
+        raise ValueError("key columns differ in length")
+    if descending is None:
+        descending = [False] * len(columns)
+    if len(descending) != len(columns):
+        raise ValueError("need one direction flag per key column")
+    if bounds is None:
+        bounds = [(min(c), max(c)) if n else (0, 0) for c in columns]
+    index_bits = max(1, (n - 1).bit_length()) if with_index and n else 0
+    layout = KeyLayout(list(bounds), list(descending), index_bits)
+    if max_bits is not None and layout.bits > max_bits:
+        raise ValueError(f"packed keys need {layout.bits} bits, more than {max_bits}")
+
+    keys = [0] * n
+    for column, (low, high), width, desc in zip(
+        columns, layout.bounds, layout.widths, descending
+    ):
+        for i, value in enumerate(column):
+            if not low <= value <= high:
+                raise ValueError(f"{value} is outside the bounds [{low}, {high}]")
+            keys[i] = (keys[i] << width) | ((high - value) if desc else (value - low))
+    if index_bits:
+        keys = [(key << index_bits) | i for i, key in enumerate(keys)]
+    return keys, layout
+
+
+def unpack_keys(
+    keys: Sequence[int], layout: KeyLayout
+) -> Tuple[List[List[int]], List[int]]:
+    """
+    Inverts `pack_keys`.
+
+    Returns:
+        The key columns and the row indices (empty if packed without index).
+    """
+    index_mask = (1 << layout.index_bits) - 1
+    indices = [key & index_mask for key in keys] if layout.index_bits else []
+    rest = [key >> layout.index_bits for key in keys]
+    columns: List[List[int]] = []
+    # The least significant column comes last.
+    for (low, high), width, desc in reversed(
+        list(zip(layout.bounds, layout.widths, layout.descending))
+    ):
+        mask = (1 << width) - 1
+        if desc:
+            columns.append([high - (r & mask) for r in rest])
+        else:
+            columns.append([low + (r & mask) for r in rest])
+        rest = [r >> width for r in rest]
+    columns.reverse()
+    return columns, indices
+
+
+def composite_sort_ca(
+    columns: Sequence[Sequence[int]],
+    descending: Optional[Sequence[bool]] = None,
+    CompareAggregate: CompareAggregateFn = compare_aggregate,
+    iterations: int = 3,
+) -> List[int]:
+    """
+    Sorts rows by a composite key with `aav86_sort_ca`, one CA comparison per
+    pair of rows. Equal keys keep their row order.
+
+    Returns:
+        The row indices in sorted order.
+    """
+    keys, layout = pack_keys(columns, descending)
+    _, indices = unpack_keys(aav86_sort_ca(keys, iterations, CompareAggregate), layout)
+    return indices
+
+
+def composite_top_k_ca(
+    columns: Sequence[Sequence[int]],
+    k: int,
+    descending: Optional[Sequence[bool]] = None,
+    CompareAggregate: CompareAggregateFn = compare_aggregate,
+) -> List[int]:
+    """
+    The k first rows by a composite key, in two CA rounds (see
+    `algorithms.top_k`). Equal keys keep their row order.
+
+    Returns:
+        The indices of the top `k` rows, in order.
+    """
+    keys, layout = pack_keys(columns, descending)
+    top = sorted_top_k_two_round_ca(keys, k, CompareAggregate)
+    _, indices = unpack_keys(top, layout)
+    return indices
@@ -0,0 +1,312 @@
+"""
+Compact binary format for comparison graphs and CompareAggregate schedules.
+
+A file holds a sequence of graph records, e.g. every graph one algorithm run
+passes to CompareAggregate, in call order. All integers are little-endian.
+
+File header (8 bytes):
+    magic    4s   b"CAGS"
+    version  u16  FORMAT_VERSION
+    reserved u16  0
+
+Record header (20 bytes), followed by an int32 payload:
+    kind         u8 (+3 pad)  EDGES, CLIQUE or BICLIQUE
+    round        u32          round of the CompareAggregate call
+    num_vertices u32          length of the CompareAggregate input
+    count_a      u32          EDGES: number of edges
+                              CLIQUE: number of clique vertices (0: all)
+                              BICLIQUE: size of the first side
+    count_b      u32          BICLIQUE: size of the second side, else 0
+
+    EDGES payload:    int32[2 * count_a], the edges as (i, j) pairs
+    CLIQUE payload:   int32[count_a], the clique's vertices
+    BICLIQUE payload: int32[count_a] then int32[count_b], the two sides
+
+Cliques and bicliques, which make up most graphs the algorithms issue, are
+stored symbolically. Since headers and payloads are multiples of 4 bytes,
+`GraphSchedule` can hand out the payloads as int32 memoryviews of the
+memory-mapped file without copying (`numpy.frombuffer` accepts them as is).
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+from typing import Any, BinaryIO, Iterator, List, Sequence, Tuple
+
+from compare_aggregate import (
+    compare_aggregate,
+    complete_graph,
+    CompareAggregateFn,
+    CountingCompareAggregate,
+)
+
+MAGIC = b"CAGS"
+FORMAT_VERSION = 1
+
+EDGES = 0
+CLIQUE = 1
+BICLIQUE = 2
+
+_FILE_HEADER = struct.Struct("<4sHH")
+_RECORD_HEADER = struct.Struct("<B3xIIII")
+_INT32_MAX = 2**31 - 1
+
+
+def encode_graph(
+    num_vertices: int, H: Sequence[Tuple[int, int]]
+) -> Tuple[int, Sequence[int], Sequence[int]]:
+    """
+    Chooses the most compact representation of the graph H.
+
+    Returns:
+        A tuple `(kind, a, b)`: for EDGES, `a` is the flattened edge list; for
+        CLIQUE, `a` lists the clique's vertices (empty if it spans all
+        `num_vertices`); for BICLIQUE, `a` and `b` are the two sides.
+    """
+    if num_vertices > _INT32_MAX:
+        raise ValueError(f"{num_vertices} vertices do not fit into int32")
+    m = len(H)
+    if m > 0:
+        left = {i for i, _ in H}
+        right = {j for _, j in H}
+        vertices = left | right
+        v = len(vertices)
+        # Cheap size checks first; the set of edges is only built on a match.
+        if m == v * (v - 1) // 2 and len({(min(e), max(e)) for e in H}) == m:
+            if all(i != j for i, j in H):
+                if v == num_vertices:
+                    return CLIQUE, [], []
+                return CLIQUE, sorted(vertices), []
+        if m == len(left) * len(right) and not left & right and len(set(H)) == m:
+            return BICLIQUE, sorted(left), sorted(right)
+    flat = [v for edge in H for v in edge]
+    return EDGES, flat, []
+
+
+def _int32_array(values: Sequence[int]) -> array:
+    a = array("i", values)
+    if sys.byteorder != "little":
+        a.byteswap()
+    return a
+
+
+def write_record(f: BinaryIO, round_index: int, num_vertices: int, H) -> None:
+    """Writes the graph H on `num_vertices` vertices to `f` as one record."""
+    kind, a, b = encode_graph(num_vertices, H)
+    count_a = len(a) // 2 if kind == EDGES else len(a)
+    f.write(_RECORD_HEADER.pack(kind, round_index, num_vertices, count_a, len(b)))
+    f.write(_int32_array(a).tobytes())
+    f.write(_int32_array(b).tobytes())
+
+
+class GraphScheduleWriter(CountingCompareAggregate):
+    """
+    A CompareAggregate wrapper that appends every graph it is called with to
+    a schedule file, together with the call's round.
+
+    Use it as the `CompareAggregate` argument of any algorithm to dump the
+    algorithm's full per-round graph schedule:
+
+        with GraphScheduleWriter("aav86.cags") as ca:
+            aav86_sort_ca(x, 3, ca)
+
+    Graphs can also be written directly with `write`.
+    """
+
+    def __init__(
+        self, path: str, CompareAggregate: CompareAggregateFn = compare_aggregate
+    ):
+        super().__init__(CompareAggregate)
+        self.path = path
+        self._file = open(path, "wb")
+        self._file.write(_FILE_HEADER.pack(MAGIC, FORMAT_VERSION, 0))
+
+    def __call__(self, x: List[Any], H: List[Tuple[int, int]]) -> List[int]:
+        round_index = self._round
+        ranks = super().__call__(x, H)
+        self.write(round_index, len(x), H)
+        return ranks
+
+    def write(self, round_index: int, num_vertices: int, H) -> None:
+        """Appends the graph H on `num_vertices` vertices as one record."""
+        write_record(self._file, round_index, num_vertices, H)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class GraphRecord:
+    """
+    One graph of a `GraphSchedule`.
+
+    The payload fields are int32 memoryviews into the schedule's memory map:
+    `edges` (flattened (i, j) pairs) for EDGES, `vertices` for CLIQUE (empty
+    if the clique spans all vertices), and `side_a`/`side_b` for BICLIQUE.
+    """
+
+    __slots__ = (
+        "kind",
+        "round",
+        "num_vertices",
+        "edges",
+        "vertices",
+        "side_a",
+        "side_b",
+    )
+
+    def __init__(self, kind, round_index, num_vertices, a, b):
+        self.kind = kind
+        self.round = round_index
+        self.num_vertices = num_vertices
+        self.edges = a if kind == EDGES else None
+        self.vertices = a if kind == CLIQUE else None
+        self.side_a = a if kind == BICLIQUE else None
+        self.side_b = b if kind == BICLIQUE else None
+
+    @property
+    def num_edges(self) -> int:
+        if self.kind == EDGES:
+            return len(self.edges) // 2
+        if self.kind == CLIQUE:
+            v = len(self.vertices) or self.num_vertices
+            return v * (v - 1) // 2
+        return len(self.side_a) * len(self.side_b)
+
+    def to_edges(self) -> List[Tuple[int, int]]:
+        """Materializes the graph as a list of edges (copies)."""
+        if self.kind == EDGES:
+            flat = self.edges
+            return [(flat[i], flat[i + 1]) for i in range(0, len(flat), 2)]
+        if self.kind == CLIQUE:
+            if len(self.vertices) == 0:
+                return complete_graph(self.num_vertices)
+            vs = self.vertices
+            return [
+                (vs[i], vs[j]) for i in range(len(vs)) for j in range(i + 1, len(vs))
+            ]
+        return [(i, j) for i in self.side_a for j in self.side_b]
+
+
+def _int32_view(buffer: memoryview, offset: int, count: int, views: List[memoryview]):
+    raw = buffer[offset : offset + 4 * count]
+    if sys.byteorder != "little":
+        a = array("i", raw)
+        a.byteswap()
+        return a
+    view = raw.cast("i")
+    views.extend((raw, view))
+    return view
+
+
+def read_record(
+    buffer: memoryview, offset: int, views: List[memoryview]
+) -> Tuple[GraphRecord, int]:
+    """
+    Reads the record at `offset` of `buffer` without copying its payload.
+
+    The memoryviews the record holds are appended to `views`; release them
+    before releasing `buffer`.
+
+    Returns:
+        The record and the offset just past it.
+    """
+    kind, round_index, num_vertices, count_a, count_b = _RECORD_HEADER.unpack_from(
+        buffer, offset
+    )
+    offset += _RECORD_HEADER.size
+    len_a = 2 * count_a if kind == EDGES else count_a
+    a = _int32_view(buffer, offset, len_a, views)
+    offset += 4 * len_a
+    b = _int32_view(buffer, offset, count_b, views)
+    offset += 4 * count_b
+    return GraphRecord(kind, round_index, num_vertices, a, b), offset
+
+
+class GraphSchedule:
+    """
+    A schedule file, memory-mapped for zero-copy access to its records.
+
+        with GraphSchedule("aav86.cags") as schedule:
+            for record in schedule:
+                ...
+
+    The records' memoryviews are only valid until the schedule is closed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._views: List[memoryview] = []
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+        magic, version, _ = _FILE_HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a CA graph schedule")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"unsupported schedule format version {version}")
+        self.records: List[GraphRecord] = []
+        offset = _FILE_HEADER.size
+        while offset < len(self._buffer):
+            record, offset = read_record(self._buffer, offset, self._views)
+            self.records.append(record)
+
+    @property
+    def num_rounds(self) -> int:
+        return max((r.round for r in self.records), default=-1) + 1
+
+    def rounds(self) -> List[List[GraphRecord]]:
+        """Groups the records by round."""
+        grouped: List[List[GraphRecord]] = [[] for _ in range(self.num_rounds)]
+        for record in self.records:
+            grouped[record.round].append(record)
+        return grouped
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __getitem__(self, i: int) -> GraphRecord:
+        return self.records[i]
+
+    def __iter__(self) -> Iterator[GraphRecord]:
+        return iter(self.records)
+
+    def close(self) -> None:
+        for record in self.records:
+            record.edges = record.vertices = record.side_a = record.side_b = None
+        self.records = []
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._buffer.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def save_graph(path: str, num_vertices: int, H, round_index: int = 0) -> None:
+    """Writes a single graph to `path`."""
+    writer = GraphScheduleWriter(path)
+    try:
+        writer.write(round_index, num_vertices, H)
+    finally:
+        writer.close()
+
+
+def load_graph(path: str) -> Tuple[int, List[Tuple[int, int]]]:
+    """Reads the first graph of `path` as `(num_vertices, edges)`."""
+    with GraphSchedule(path) as schedule:
+        record = schedule[0]
+        return record.num_vertices, record.to_edges()
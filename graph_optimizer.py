@@ -0,0 +1,130 @@
+"""
+Optimization passes over the comparison graphs an algorithm issues.
+
+Three rewrites keep every result the same and save calls or edges:
+
+- `dedupe_edges` drops repeated edges, (i, j) and (j, i) included, in
+  linear time.
+- `derive_subranking` reads the ranks within a vertex subset off an existing
+  call instead of issuing a second call on the subset. This works whenever
+  the subset is a clique whose vertices all have the same neighbors outside
+  it, like the pivots in AAV86 (see `aav86_sort_ca`).
+- `optimize_schedule` merges the calls of each round, which always act on
+  disjoint inputs, into one call per round, and reports the call and edge
+  counts before and after:
+
+    with GraphSchedule("aav86.cags") as schedule:
+        calls, report = optimize_schedule(
+            (r.round, r.num_vertices, r.to_edges()) for r in schedule
+        )
+
+`async_scheduler.RoundScheduler(coalesce=True)` applies the merge at run
+time.
+"""
+
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+Edge = Tuple[int, int]
+
+
+def dedupe_edges(H: Iterable[Edge]) -> List[Edge]:
+    """
+    Removes duplicate edges in linear time. Edges are oriented as (i, j) with
+    i < j; the order of first occurrence is kept.
+    """
+    return list(dict.fromkeys((i, j) if i < j else (j, i) for i, j in H))
+
+
+def derive_subranking(
+    H: Sequence[Edge],
+    ranks: Sequence[int],
+    subset: Sequence[int],
+    check: bool = True,
+) -> List[int]:
+    """
+    Ranks of the vertices `subset` among themselves, derived from the local
+    ranks of a CompareAggregate call on H.
+
+    If `subset` is a clique in H and every vertex outside it is adjacent to
+    either all or none of it, the local rank of a subset vertex is the number
+    of subset vertices below it plus the number of (shared) outside neighbors
+    below it. Both grow with the vertex's position, so sorting the subset by
+    local rank orders it exactly.
+
+    Args:
+        H: The graph of the call.
+        ranks: The local ranks the call returned.
+        subset: The vertices to rank.
+        check: If True, verify the condition on H first (O(|H|)).
+
+    Returns:
+        For every vertex of `subset`, in order, its rank within `subset`.
+
+    Raises:
+        ValueError: If `check` is set and the condition does not hold.
+    """
+    if check:
+        _check_module(H, subset)
+    order = sorted(range(len(subset)), key=lambda a: ranks[subset[a]])
+    subranks = [0] * len(subset)
+    for position, a in enumerate(order):
+        subranks[a] = position
+    return subranks
+
+
+def _check_module(H: Sequence[Edge], subset: Sequence[int]) -> None:
+    member = {v: a for a, v in enumerate(subset)}
+    inside = set()
+    outside: Dict[int, int] = {}
+    for i, j in H:
+        if i in member and j in member:
+            inside.add((min(i, j), max(i, j)))
+        elif i in member or j in member:
+            v = j if i in member else i
+            outside[v] = outside.get(v, 0) + 1
+    s = len(subset)
+    if len(inside) != s * (s - 1) // 2:
+        raise ValueError("the subset is not a clique")
+    if any(count != s for count in outside.values()):
+        raise ValueError("outside vertices see only part of the subset")
+
+
+def optimize_schedule(
+    calls: Iterable[Tuple[int, int, Sequence[Edge]]],
+) -> Tuple[List[Tuple[int, int, List[Edge]]], Dict[str, Any]]:
+    """
+    Merges the calls of every round into one call and drops duplicate edges.
+
+    Calls in the same round do not depend on each other and act on separate
+    inputs, so placing their inputs side by side (as `merge_calls` does)
+    turns them into one call on the disjoint union of their graphs.
+
+    Args:
+        calls: `(round, num_vertices, H)` for every call, e.g. from the
+            records of a `graph_format.GraphSchedule`.
+
+    Returns:
+        The optimized calls as `(round, num_vertices, H)`, one per round, and
+        a report with the number of `calls`, `edges` and `rounds` before and
+        after.
+    """
+    by_round: Dict[int, Tuple[int, List[Edge]]] = {}
+    calls_before = edges_before = 0
+    for round_index, num_vertices, H in calls:
+        calls_before += 1
+        edges_before += len(H)
+        offset, merged = by_round.get(round_index, (0, []))
+        merged.extend((i + offset, j + offset) for i, j in dedupe_edges(H))
+        by_round[round_index] = (offset + num_vertices, merged)
+    optimized = [
+        (round_index, num_vertices, H)
+        for round_index, (num_vertices, H) in sorted(by_round.items())
+    ]
+    report = {
+        "calls_before": calls_before,
+        "calls_after": len(optimized),
+        "edges_before": edges_before,
+        "edges_after": sum(len(H) for _, _, H in optimized),
+        "rounds": len(optimized),
+    }
+    return optimized, report
@@ -0,0 +1,129 @@
+"""
+Batched k-nearest-neighbor search on top of the Compare-Aggregate top-k.
+
+The distances between a batch of queries and a reference set are computed
+with NumPy and quantized to fixed-width unsigned integers, the form a
+comparison backend (e.g. an FSS comparison on n-bit shares) works on. The k
+smallest codes of every query are then found with `batched_sorted_top_k_ca`,
+so all queries of a batch share the same two CompareAggregate rounds:
+
+    neighbors, report = knn_ca(queries, references, k=10)
+    print(report["queries_per_second"], report["edges_per_query"])
+
+Quantization maps distances that differ by less than one step to the same
+code; such ties go to the reference with the smaller index. NumPy is
+required.
+"""
+
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from algorithms.top_k import batched_sorted_top_k_ca, top_k_edges, top_k_rounds
+from compare_aggregate import (
+    compare_aggregate,
+    CompareAggregateFn,
+    CountingCompareAggregate,
+)
+
+METRICS = ("sqeuclidean", "euclidean", "manhattan")
+
+# Number of queries whose |query - reference| differences are materialized at
+# once for the manhattan metric.
+_MANHATTAN_CHUNK = 64
+
+
+def pairwise_distances(
+    queries: np.ndarray, references: np.ndarray, metric: str = "sqeuclidean"
+) -> np.ndarray:
+    """
+    Distances between every query and every reference point.
+
+    Args:
+        queries: Array of shape (q, d).
+        references: Array of shape (n, d).
+        metric: One of `METRICS`.
+
+    Returns:
+        Array of shape (q, n).
+    """
+    Q = np.asarray(queries, dtype=np.float64)
+    R = np.asarray(references, dtype=np.float64)
+    if Q.ndim != 2 or R.ndim != 2 or Q.shape[1] != R.shape[1]:
+        raise ValueError("queries and references must be 2-D with equal width")
+    if metric == "manhattan":
+        D = np.empty((len(Q), len(R)))
+        for start in range(0, len(Q), _MANHATTAN_CHUNK):
+            chunk = Q[start : start + _MANHATTAN_CHUNK]
+            D[start : start + len(chunk)] = np.abs(
+                chunk[:, None, :] - R[None, :, :]
+            ).sum(axis=2)
+        return D
+    if metric not in METRICS:
+        raise ValueError(f"unknown metric {metric!r}")
+    # |q - r|^2 = |q|^2 + |r|^2 - 2 q.r, as one matrix product.
+    D = (Q * Q).sum(axis=1)[:, None] + (R * R).sum(axis=1)[None, :] - 2 * Q @ R.T
+    np.maximum(D, 0, out=D)
+    if metric == "euclidean":
+        np.sqrt(D, out=D)
+    return D
+
+
+def encode_distances(D: np.ndarray, bits: int = 32) -> Tuple[np.ndarray, float]:
+    """
+    Quantizes non-negative distances to unsigned `bits`-bit integers, keeping
+    their order (up to ties).
+
+    Returns:
+        The codes (uint64) and the scale: code = floor(distance * scale).
+    """
+    if not 1 <= bits <= 63:
+        raise ValueError("bits must be between 1 and 63")
+    top = float(D.max()) if D.size else 0.0
+    scale = ((1 << bits) - 1) / top if top > 0 else 1.0
+    codes = np.floor(D * scale).astype(np.uint64)
+    return codes, scale
+
+
+def knn_ca(
+    queries: np.ndarray,
+    references: np.ndarray,
+    k: int,
+    CompareAggregate: CompareAggregateFn = compare_aggregate,
+    metric: str = "sqeuclidean",
+    bits: int = 32,
+) -> Tuple[List[List[int]], Dict[str, Any]]:
+    """
+    The k nearest references of every query, found with CA top-k.
+
+    Args:
+        queries: Array of shape (q, d).
+        references: Array of shape (n, d).
+        k: Number of neighbors per query.
+        CompareAggregate: The Compare-Aggregate function to use.
+        metric: One of `METRICS`.
+        bits: Width of the distance codes.
+
+    Returns:
+        A tuple `(neighbors, report)`. `neighbors` holds, for every query,
+        the indices of its k nearest references, nearest first. `report`
+        holds the total `calls`, `rounds` and `edges`, the `edges_per_query`,
+        the `rounds_per_query`, the `seconds` spent on distances
+        (`distance_seconds`) and in total, and the `queries_per_second`.
+    """
+    counter = CountingCompareAggregate(CompareAggregate)
+    start = time.perf_counter()
+    codes, _ = encode_distances(pairwise_distances(queries, references, metric), bits)
+    distances_done = time.perf_counter()
+    neighbors = batched_sorted_top_k_ca(codes.tolist(), k, counter)
+    seconds = time.perf_counter() - start
+
+    num_queries, n = codes.shape
+    report = counter.report()
+    report["rounds_per_query"] = top_k_rounds(n, k) if num_queries else 0
+    report["edges_per_query"] = top_k_edges(n, k) if num_queries else 0
+    report["distance_seconds"] = distances_done - start
+    report["seconds"] = seconds
+    report["queries_per_second"] = num_queries / seconds if seconds > 0 else 0.0
+    return neighbors, report
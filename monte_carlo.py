@@ -0,0 +1,193 @@
+"""
+Monte Carlo harness for the failure rates of the randomized CA algorithms.
+
+The algorithms in `algorithms/misc.py` prune their candidate sets by random
+sampling, so they may return wrong or short results, or take a fallback path.
+This module runs many seeded trials per (n, k, rounds) setting on a process
+pool and reports the error rate, the fallback rate, and the distribution of
+surviving-set sizes, edges and rounds, as counted by `CountingCompareAggregate`.
+
+Example:
+
+    python monte_carlo.py median_BB90_4iter_CA --n 1000 10000 --trials 2000
+"""
+
+import argparse
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from algorithms.misc import (
+    max_four_iteration_CA,
+    median_BB90_4iter_CA,
+    parallel_selection_CA,
+    sorted_top_k_braverman_CA,
+    sorted_top_k_parallel_CA,
+)
+from compare_aggregate import CountingCompareAggregate
+
+# Algorithm name -> (run(x, k, rounds, CompareAggregate, rng), expected(x, k)).
+# `k` and `rounds` are ignored by algorithms that do not take them.
+ALGORITHMS: Dict[str, Tuple[Callable, Callable]] = {
+    "sorted_top_k_braverman_CA": (
+        lambda x, k, rounds, ca, rng: sorted_top_k_braverman_CA(x, k, rounds, ca, rng),
+        lambda x, k: sorted(x)[:k],
+    ),
+    "sorted_top_k_parallel_CA": (
+        lambda x, k, rounds, ca, rng: sorted_top_k_parallel_CA(x, k, rounds, ca, rng),
+        lambda x, k: sorted(x)[:k],
+    ),
+    "parallel_selection_CA": (
+        lambda x, k, rounds, ca, rng: parallel_selection_CA(x, k, rounds, ca, rng),
+        lambda x, k: sorted(x)[k],
+    ),
+    "max_four_iteration_CA": (
+        lambda x, k, rounds, ca, rng: max_four_iteration_CA(x, ca, rng),
+        lambda x, k: max(x),
+    ),
+    "median_BB90_4iter_CA": (
+        lambda x, k, rounds, ca, rng: median_BB90_4iter_CA(x, ca, rng=rng),
+        lambda x, k: sorted(x)[len(x) // 2],
+    ),
+}
+
+
+def trial_seed(
+    seed: int, algorithm: str, n: int, k: int, rounds: int, trial: int
+) -> str:
+    """The seed of one trial; independent of how trials are spread over processes."""
+    return f"{seed}:{algorithm}:{n}:{k}:{rounds}:{trial}"
+
+
+def run_trial(algorithm: str, n: int, k: int, rounds: int, seed: str) -> Dict[str, Any]:
+    """
+    Runs `algorithm` once on n random integers.
+
+    Both the input and the algorithm's own sampling are drawn from one
+    `random.Random(seed)`, so a trial can be reproduced from its seed alone
+    and leaves the global `random` state alone.
+
+    Returns:
+        A dictionary with the fields `error`, `short` (fewer than k results),
+        `fallback`, `survivors` (number of vertices in the final CA call),
+        `edges`, `rounds` and `calls`.
+    """
+    run, expected = ALGORITHMS[algorithm]
+    rng = random.Random(seed)
+    x = [rng.randrange(10 * n) for _ in range(n)]
+    counter = CountingCompareAggregate()
+    result = run(x, k, rounds, counter, rng)
+    return {
+        "error": result != expected(x, k),
+        "short": isinstance(result, list) and len(result) < min(k, n),
+        "fallback": bool(counter.fallbacks),
+        "survivors": counter.log[-1][1] if counter.log else 0,
+        "edges": counter.edges,
+        "rounds": counter.rounds,
+        "calls": counter.calls,
+    }
+
+
+def _run_trial(task: Tuple[str, int, int, int, str]) -> Dict[str, Any]:
+    return run_trial(*task)
+
+
+def summarize(values: Sequence[float]) -> Dict[str, float]:
+    """Mean, percentiles and maximum of `values`."""
+    ordered = sorted(values)
+    if not ordered:
+        return {}
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    return {
+        "mean": sum(ordered) / len(ordered),
+        "p50": percentile(0.50),
+        "p90": percentile(0.90),
+        "p99": percentile(0.99),
+        "max": ordered[-1],
+    }
+
+
+def monte_carlo(
+    algorithm: str,
+    settings: Sequence[Tuple[int, int, int]],
+    trials: int = 1000,
+    seed: int = 0,
+    processes: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Runs `trials` seeded trials of `algorithm` for every (n, k, rounds) setting.
+
+    Args:
+        algorithm: A key of `ALGORITHMS`.
+        settings: The (n, k, rounds) settings to measure.
+        trials: Number of trials per setting.
+        seed: Base seed; trial seeds are derived with `trial_seed`.
+        processes: Size of the process pool (default: number of CPUs). With
+            `processes=1` the trials run in the current process.
+
+    Returns:
+        One report per setting, with the error, short-result and fallback
+        rates and summaries of the surviving-set sizes, edges and rounds.
+    """
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"unknown algorithm {algorithm!r}")
+    tasks = [
+        (algorithm, n, k, rounds, trial_seed(seed, algorithm, n, k, rounds, t))
+        for n, k, rounds in settings
+        for t in range(trials)
+    ]
+    if processes == 1:
+        results = [_run_trial(task) for task in tasks]
+    else:
+        workers = processes or os.cpu_count() or 1
+        chunksize = max(1, len(tasks) // (4 * workers))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_run_trial, tasks, chunksize=chunksize))
+
+    reports = []
+    for s, (n, k, rounds) in enumerate(settings):
+        batch = results[s * trials : (s + 1) * trials]
+        reports.append(
+            {
+                "algorithm": algorithm,
+                "n": n,
+                "k": k,
+                "rounds": rounds,
+                "trials": trials,
+                "error_rate": sum(r["error"] for r in batch) / trials,
+                "short_rate": sum(r["short"] for r in batch) / trials,
+                "fallback_rate": sum(r["fallback"] for r in batch) / trials,
+                "survivors": summarize([r["survivors"] for r in batch]),
+                "edges": summarize([r["edges"] for r in batch]),
+                "ca_rounds": summarize([r["rounds"] for r in batch]),
+            }
+        )
+    return reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("algorithm", choices=sorted(ALGORITHMS))
+    parser.add_argument("--n", type=int, nargs="+", default=[1000])
+    parser.add_argument("--k", type=int, nargs="+", default=[10])
+    parser.add_argument("--rounds", type=int, nargs="+", default=[3])
+    parser.add_argument("--trials", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    settings = [(n, k, r) for n in args.n for k in args.k for r in args.rounds]
+    for report in monte_carlo(
+        args.algorithm, settings, args.trials, args.seed, args.processes
+    ):
+        print(
+            f"n={report['n']} k={report['k']} rounds={report['rounds']}: "
+            f"error={report['error_rate']:.4f} short={report['short_rate']:.4f} "
+            f"fallback={report['fallback_rate']:.4f} "
+            f"survivors p50/p99={report['survivors']['p50']}/{report['survivors']['p99']} "
+            f"edges mean/p99={report['edges']['mean']:.0f}/{report['edges']['p99']}"
+        )
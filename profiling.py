@@ -0,0 +1,197 @@
+"""
+Opt-in profiling spans for the Compare-Aggregate algorithms.
+
+The algorithms wrap each of their phases (graph construction, the CA call,
+partitioning, recursion, assembly) in a `span`. Spans are only recorded while
+a `Profiler` is active:
+
+    with profile() as prof:
+        aav86_sort_ca(x, 3)
+    prof.export_chrome_trace("trace.json")
+
+The exported file can be opened in chrome://tracing or https://ui.perfetto.dev.
+When no profiler is active, `span` returns a shared no-op context manager, so
+the instrumented algorithms pay one global lookup per phase.
+"""
+
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# The profiler that `span` records into, or None when profiling is off.
+_active_profiler: Optional["Profiler"] = None
+
+
+class _NullSpan:
+    """Stand-in returned by `span` when profiling is off."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **args: Any) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """A single timed phase. Created by `span`, recorded on exit."""
+
+    __slots__ = ("profiler", "name", "args", "start", "mem_start", "child_peak")
+
+    def __init__(self, profiler: "Profiler", name: str, args: Dict[str, Any]):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+        self.child_peak = 0
+
+    def set(self, **args: Any) -> None:
+        """Attach (or overwrite) arguments, e.g. edge counts known only later."""
+        self.args.update(args)
+
+    def __enter__(self):
+        profiler = self.profiler
+        profiler._stack.append(self)
+        if profiler.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            self.mem_start = current
+            # The peak is reset so that this span sees only its own high-water
+            # mark; the enclosing span gets it back through `child_peak`.
+            if len(profiler._stack) > 1:
+                parent = profiler._stack[-2]
+                parent.child_peak = max(parent.child_peak, peak)
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        profiler = self.profiler
+        profiler._stack.pop()
+        args = self.args
+        if profiler.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, self.child_peak)
+            args["alloc_bytes"] = current - self.mem_start
+            args["peak_bytes"] = peak - self.mem_start
+            if profiler._stack:
+                parent = profiler._stack[-1]
+                parent.child_peak = max(parent.child_peak, peak)
+        profiler.events.append(
+            {
+                "name": self.name,
+                "ts": (self.start - profiler.origin_ns) / 1000,
+                "dur": (end - self.start) / 1000,
+                "depth": len(profiler._stack),
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+        )
+        return False
+
+
+class Profiler:
+    """
+    Collects the spans recorded while it is active.
+
+    Args:
+        trace_memory: If True, record the net allocation (`alloc_bytes`) and
+            the allocation high-water mark (`peak_bytes`) of every span using
+            `tracemalloc`. This slows the traced code down considerably.
+    """
+
+    def __init__(self, trace_memory: bool = True):
+        self.trace_memory = trace_memory
+        self.events: List[Dict[str, Any]] = []
+        self.origin_ns = time.perf_counter_ns()
+        self._stack: List[_Span] = []
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Aggregates the recorded spans by name.
+
+        Returns:
+            A dictionary mapping each span name to its call count, total wall
+            time in milliseconds, and total number of edges (if recorded).
+        """
+        summary: Dict[str, Dict[str, float]] = {}
+        for event in self.events:
+            entry = summary.setdefault(
+                event["name"], {"count": 0, "total_ms": 0.0, "edges": 0}
+            )
+            entry["count"] += 1
+            entry["total_ms"] += event["dur"] / 1000
+            entry["edges"] += event["args"].get("edges", 0)
+        return summary
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Returns the recorded spans in the Chrome trace event format."""
+        pid = os.getpid()
+        trace_events = [
+            {
+                "name": event["name"],
+                "cat": "ca",
+                "ph": "X",
+                "ts": event["ts"],
+                "dur": event["dur"],
+                "pid": pid,
+                "tid": event["tid"],
+                "args": event["args"],
+            }
+            # Chrome/Perfetto nest complete events by start time, parents first.
+            for event in sorted(self.events, key=lambda e: (e["ts"], e["depth"]))
+        ]
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path: str) -> None:
+        """Writes the recorded spans to `path` as Chrome trace / Perfetto JSON."""
+        with open(path, "w") as f:
+            json.dump(self.to_chrome_trace(), f)
+
+
+def span(name: str, **args: Any):
+    """
+    Returns a context manager timing the phase `name`.
+
+    Keyword arguments (e.g. `n=len(x)` or `edges=len(H)`) are stored with the
+    span and show up in the trace viewer. Returns a no-op context manager when
+    no profiler is active.
+    """
+    profiler = _active_profiler
+    if profiler is None:
+        return _NULL_SPAN
+    return _Span(profiler, name, args)
+
+
+@contextmanager
+def profile(trace_memory: bool = True) -> Iterator[Profiler]:
+    """
+    Activates a new `Profiler` for the duration of the `with` block.
+
+    Args:
+        trace_memory: Passed on to `Profiler`. `tracemalloc` is started if it
+            is not already running, and stopped again afterwards.
+    """
+    global _active_profiler
+    previous = _active_profiler
+    profiler = Profiler(trace_memory=trace_memory)
+    started_tracemalloc = trace_memory and not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start()
+    _active_profiler = profiler
+    try:
+        yield profiler
+    finally:
+        _active_profiler = previous
+        if started_tracemalloc:
+            tracemalloc.stop()
@@ -1,10 +1,51 @@
 import pytest
 
-from algorithms.aav86 import aav86_sort, aav86_sort_ca
-from algorithms.maximum import max_two_iteration_valiant, max_two_iteration_ca
+from algorithms.aav86 import aav86_sort, aav86_sort_ca, aav86_sort_ca_async
+from algorithms.maximum import (
+    max_r_iteration_ca,
+    max_r_iteration_valiant,
+    max_round_schedule,
+    max_tournament_ca,
+    max_tournament_valiant,
+    max_two_iteration_valiant,
+    max_two_iteration_ca,
+    max_two_iteration_ca_async,
+)
 from algorithms.bitonic_sort import bitonic_sort
+from algorithms.sorting_networks import NETWORKS, network_cost, network_sort
+from algorithms.selection import multi_select_ca, quantiles_ca
+from algorithms.streaming import SlidingWindowTopK, stream_top_k
+from algorithms.top_k import (
+    batched_sorted_top_k_ca,
+    sorted_top_k_two_round_ca,
+    top_k_edges,
+)
+from algorithms.misc import median_BB90_4iter_CA
+from compare_aggregate import (
+    ca_branch,
+    ca_parallel,
+    compare_aggregate,
+    compare_direct,
+    complete_graph,
+    select_kth,
+    select_kth_CA,
+    sorted_top_k,
+    sorted_top_k_CA,
+    CountingCompareAggregate,
+)
+from async_scheduler import RoundScheduler, to_async
+import asyncio
+import auction
+import ca_cache
+import cli
+import composite_keys
+import graph_format
+import graph_optimizer
+import itertools
+import monte_carlo
+import profiling
 import random
-
+import transcript
 
 # --- Test Data (Not yet currently used by tests) ---
 
@@ -180,3 +221,745 @@ def test_bitonic_sort_stability():
         StableItem(5, 4),
     ]
     assert input_list == expected_order
+
+
+@pytest.mark.parametrize(
+    "input_list",
+    [
+        [3, 1, 4, 1, 5, 9, 2, 6],
+        REPEATED_ITEMS,
+        [random.randint(0, 1000) for _ in range(50)],
+    ],
+)
+def test_select_and_top_k(input_list):
+    expected = sorted(input_list)
+    for k in (0, len(input_list) // 2, len(input_list) - 1):
+        assert select_kth(input_list, k) == expected[k]
+        assert select_kth_CA(input_list, k) == expected[k]
+    assert sorted_top_k(input_list, 3) == expected[:3]
+    assert sorted_top_k_CA(input_list, 3) == expected[:3]
+
+
+def test_profiling_spans_nest_across_recursion():
+    input_list = [random.randint(0, 1000) for _ in range(100)]
+    with profiling.profile() as prof:
+        assert aav86_sort_ca(input_list, 3) == sorted(input_list)
+
+    names = {event["name"] for event in prof.events}
+    assert {"graph_build", "ca_eval", "partition", "recursion", "assemble"} <= names
+    # The outermost call is the top-level span and encloses every other span.
+    outer = [e for e in prof.events if e["depth"] == 0]
+    assert len(outer) == 1 and outer[0]["name"] == "aav86_sort_ca"
+    assert max(e["depth"] for e in prof.events) > 2
+    assert prof.summary()["ca_eval"]["edges"] > 0
+
+    trace = prof.to_chrome_trace()["traceEvents"]
+    assert all(e["ph"] == "X" and "alloc_bytes" in e["args"] for e in trace)
+    assert trace[0]["name"] == "aav86_sort_ca"
+
+
+def test_profiling_off_records_nothing():
+    assert profiling.span("ca_eval", edges=1) is profiling._NULL_SPAN
+    with profiling.profile(trace_memory=False) as prof:
+        pass
+    aav86_sort_ca([3, 1, 2], 2)
+    assert prof.events == []
+
+
+def test_counting_compare_aggregate_rounds():
+    counter = CountingCompareAggregate()
+    counter([1, 2, 3], [(0, 1), (1, 2)])
+    with ca_parallel(counter):
+        for _ in range(3):
+            with ca_branch(counter):
+                counter([1, 2], [(0, 1)])
+                counter([1, 2], [(0, 1)])
+    counter([1, 2], [(0, 1)])
+    assert counter.report() == {"calls": 8, "edges": 9, "rounds": 4, "fallbacks": {}}
+    assert [entry[0] for entry in counter.log] == [0, 1, 2, 1, 2, 1, 2, 3]
+
+
+@pytest.mark.parametrize(
+    "input_list",
+    [
+        [5],
+        [3, 1, 4, 1, 5, 9, 2, 6],
+        REPEATED_ITEMS,
+        [random.randint(0, 10) for _ in range(500)],
+        [random.randint(0, 10**6) for _ in range(2000)],
+    ],
+)
+def test_median_BB90_4iter_CA(input_list):
+    counter = CountingCompareAggregate()
+    actual = median_BB90_4iter_CA(input_list, counter)
+    assert actual == sorted(input_list)[len(input_list) // 2]
+    if len(input_list) >= 1000:
+        assert counter.rounds == 4 + counter.fallbacks.get("window_missed", 0)
+        # O(n) edges; typically about 7n, the bucket size has a long tail.
+        assert counter.edges <= 60 * len(input_list)
+
+
+@pytest.mark.parametrize("n, distinct", [(1000, 1), (5000, 4), (20000, 11)])
+def test_median_BB90_4iter_CA_ties(n, distinct):
+    input_list = [random.randrange(distinct) for _ in range(n)]
+    counter = CountingCompareAggregate()
+    assert median_BB90_4iter_CA(input_list, counter) == sorted(input_list)[n // 2]
+    # Equal values are split by index, so windows and buckets stay small.
+    assert "clique" not in counter.fallbacks
+    assert counter.edges <= 60 * n
+
+
+def test_monte_carlo_report():
+    settings = [(200, 5, 3), (400, 5, 3)]
+    reports = monte_carlo.monte_carlo(
+        "median_BB90_4iter_CA", settings, trials=20, processes=2
+    )
+    assert [(r["n"], r["k"], r["rounds"]) for r in reports] == settings
+    for report in reports:
+        assert report["error_rate"] == 0.0
+        assert 0.0 <= report["fallback_rate"] <= 1.0
+        assert report["survivors"]["max"] <= report["n"]
+        assert report["ca_rounds"]["p50"] >= 4
+
+
+def test_monte_carlo_trials_are_reproducible():
+    seed = monte_carlo.trial_seed(0, "sorted_top_k_parallel_CA", 300, 10, 3, 7)
+    first = monte_carlo.run_trial("sorted_top_k_parallel_CA", 300, 10, 3, seed)
+    second = monte_carlo.run_trial("sorted_top_k_parallel_CA", 300, 10, 3, seed)
+    assert first == second
+    # Trials draw from their own generator, not the global one.
+    state = random.getstate()
+    monte_carlo.run_trial("median_BB90_4iter_CA", 300, 10, 3, seed)
+    assert random.getstate() == state
+
+
+@pytest.mark.parametrize(
+    "algorithm", ["sorted_top_k_parallel_CA", "parallel_selection_CA"]
+)
+def test_monte_carlo_parallel_error_rate(algorithm):
+    settings = [(300, 1, 2), (300, 10, 3), (1000, 50, 4)]
+    reports = monte_carlo.monte_carlo(algorithm, settings, trials=30, processes=1)
+    for report in reports:
+        assert report["error_rate"] == 0.0
+        assert report["short_rate"] == 0.0
+
+
+@pytest.mark.parametrize(
+    "num_vertices, H, kind",
+    [
+        (5, [(0, 1), (3, 2), (4, 4)], graph_format.EDGES),
+        (4, [(0, 1), (0, 2), (0, 3), (1, 2), (1, 3), (2, 3)], graph_format.CLIQUE),
+        (6, [(1, 3), (5, 1), (3, 5)], graph_format.CLIQUE),
+        (7, [(i, j) for i in range(4) for j in (5, 6)], graph_format.BICLIQUE),
+        (3, [], graph_format.EDGES),
+    ],
+)
+def test_graph_format_roundtrip(tmp_path, num_vertices, H, kind):
+    path = str(tmp_path / "graph.cags")
+    graph_format.save_graph(path, num_vertices, H)
+    with graph_format.GraphSchedule(path) as schedule:
+        record = schedule[0]
+        assert record.kind == kind
+        assert record.num_vertices == num_vertices
+        assert record.num_edges == len(H)
+    loaded_vertices, loaded = graph_format.load_graph(path)
+    assert loaded_vertices == num_vertices
+    assert {tuple(sorted(e)) for e in loaded} == {tuple(sorted(e)) for e in H}
+
+
+def test_graph_schedule_writer_dumps_every_round(tmp_path):
+    path = str(tmp_path / "aav86.cags")
+    input_list = [random.randint(0, 1000) for _ in range(200)]
+    with graph_format.GraphScheduleWriter(path) as ca:
+        assert aav86_sort_ca(input_list, 3, ca) == sorted(input_list)
+    with graph_format.GraphSchedule(path) as schedule:
+        assert len(schedule) == ca.calls
+        assert schedule.num_rounds == ca.rounds
+        assert [(r.round, r.num_vertices, r.num_edges) for r in schedule] == ca.log
+        # Payloads are zero-copy int32 views into the memory map.
+        edges = next(r.edges for r in schedule if r.kind == graph_format.EDGES)
+        assert isinstance(edges, memoryview) and edges.format == "i"
+
+
+@pytest.mark.parametrize(
+    "task, extra, expected",
+    [
+        ("sort", [], lambda x: sorted(x)),
+        ("select", ["--rank", "7"], lambda x: [sorted(x)[7]]),
+        ("top-k", ["--k", "5"], lambda x: sorted(x)[:5]),
+        ("max", [], lambda x: [max(x)]),
+        ("median", [], lambda x: [sorted(x)[len(x) // 2]]),
+        (
+            "quantiles",
+            ["--quantiles", "0.5", "0.99"],
+            lambda x: [sorted(x)[150], sorted(x)[297]],
+        ),
+    ],
+)
+def test_cli_text(tmp_path, task, extra, expected):
+    input_list = [random.randint(-1000, 1000) for _ in range(300)]
+    src, dst = tmp_path / "in.txt", tmp_path / "out.txt"
+    src.write_text("\n".join(map(str, input_list)) + "\n")
+    assert cli.main([task, str(src), "-o", str(dst)] + extra) == 0
+    assert [int(v) for v in dst.read_text().split()] == expected(input_list)
+
+
+def test_cli_binary_with_report(tmp_path, capsys):
+    input_list = [random.randint(-(2**31), 2**31 - 1) for _ in range(500)]
+    src, dst = tmp_path / "in.bin", tmp_path / "out.bin"
+    cli.write_values(str(src), "binary", "int32", input_list)
+    argv = ["sort", str(src), "-o", str(dst), "--dtype", "int32", "--report"]
+    assert cli.main(argv) == 0
+    assert cli.read_values(str(dst), "binary", "int32") == sorted(input_list)
+    assert "rounds=" in capsys.readouterr().err
+
+
+def test_cli_top_k_two_rounds(tmp_path, capsys):
+    src = tmp_path / "in.txt"
+    src.write_text("\n".join(str(random.randint(0, 10**6)) for _ in range(2000)))
+    assert cli.main(["top-k", str(src), "--k", "5", "--report"]) == 0
+    assert "rounds=2 " in capsys.readouterr().err
+
+
+def test_cli_npy_keeps_dtype(tmp_path):
+    np = pytest.importorskip("numpy")
+    src, dst = tmp_path / "in.npy", tmp_path / "out.npy"
+    np.save(src, np.array([3.7, 1.2, 2.5, 0.1]))
+    assert cli.main(["sort", str(src), "-o", str(dst)]) == 0
+    out = np.load(dst)
+    assert out.dtype == np.float64 and out.tolist() == [0.1, 1.2, 2.5, 3.7]
+    np.save(src, np.array([3, -1, 2], dtype=np.int16))
+    assert cli.main(["sort", str(src), "-o", str(dst)]) == 0
+    out = np.load(dst)
+    assert out.dtype == np.int16 and out.tolist() == [-1, 2, 3]
+    assert cli.main(["sort", str(src), "-o", str(dst), "--dtype", "float32"]) == 0
+    assert np.load(dst).dtype == np.float32
+
+
+def test_cli_text_floats_and_bad_input(tmp_path):
+    src, dst = tmp_path / "in.txt", tmp_path / "out.txt"
+    src.write_text("1.5\n3\n-2\n")
+    assert cli.main(["sort", str(src), "-o", str(dst)]) == 0
+    assert dst.read_text().split() == ["-2", "1.5", "3"]
+    src.write_text("1\nabc\n")
+    with pytest.raises(SystemExit, match="in.txt:2"):
+        cli.main(["sort", str(src), "-o", str(dst)])
+    binary = tmp_path / "in.bin"
+    binary.write_bytes(b"\x00" * 10)
+    with pytest.raises(SystemExit, match="multiple"):
+        cli.main(["sort", str(binary), "-o", str(dst), "--dtype", "int32"])
+
+
+@pytest.mark.parametrize("task", sorted(cli.TASKS))
+@pytest.mark.parametrize("output", ["out.txt", "out.bin", "out.npy"])
+def test_cli_rejects_empty_input(tmp_path, task, output):
+    src = tmp_path / "in.txt"
+    src.write_text("")
+    with pytest.raises(SystemExit, match="no input values"):
+        cli.main([task, str(src), "-o", str(tmp_path / output)])
+    assert not (tmp_path / output).exists()
+
+
+def test_cli_two_party_rejects_floats(tmp_path):
+    pytest.importorskip("numpy")
+    src, dst = tmp_path / "in.txt", tmp_path / "out.txt"
+    src.write_text("1.5\n3\n-2\n")
+    with pytest.raises(SystemExit, match="integer input"):
+        cli.main(["sort", str(src), "-o", str(dst), "--backend", "two-party"])
+    src.write_text(f"1\n{2**63}\n")
+    with pytest.raises(SystemExit, match="2\\^62"):
+        cli.main(["sort", str(src), "-o", str(dst), "--backend", "two-party"])
+    src.write_text("3\n1\n2\n")
+    assert cli.main(["sort", str(src), "-o", str(dst), "--backend", "two-party"]) == 0
+    assert dst.read_text().split() == ["1", "2", "3"]
+
+
+@pytest.mark.parametrize("rounds", [1, 2, 3, 5])
+@pytest.mark.parametrize(
+    "input_list",
+    [
+        [],
+        [5],
+        REPEATED_ITEMS,
+        [random.randint(0, 1000) for _ in range(300)],
+    ],
+)
+def test_max_r_iteration_family(input_list, rounds):
+    expected = max(input_list) if input_list else None
+    for max_fn, backend in [
+        (max_r_iteration_valiant, compare_direct),
+        (max_tournament_valiant, compare_direct),
+        (max_r_iteration_ca, compare_aggregate),
+        (max_tournament_ca, compare_aggregate),
+    ]:
+        counter = CountingCompareAggregate(backend)
+        assert max_fn(input_list, rounds, counter) == expected
+        assert counter.rounds <= rounds
+        assert counter.calls == counter.rounds
+
+
+def test_max_round_schedule_minimizes_edges():
+    # Two rounds reproduce t = n^(2/3) / 2^(1/3) of Algorithm 5.
+    assert max_round_schedule(1000, 2) == [round(1000 ** (2 / 3) / 2 ** (1 / 3)), 1]
+    input_list = [random.randint(0, 10**6) for _ in range(1000)]
+    edges = []
+    for rounds in (2, 3, 4):
+        counter = CountingCompareAggregate()
+        max_r_iteration_ca(input_list, rounds, counter)
+        edges.append(counter.edges)
+    assert edges[0] > edges[1] > edges[2]
+    counter = CountingCompareAggregate()
+    max_two_iteration_ca(input_list, counter)
+    assert edges[0] <= counter.edges
+
+
+@pytest.mark.parametrize("name", sorted(NETWORKS))
+def test_sorting_networks_zero_one_principle(name):
+    # A comparator network sorts every input iff it sorts every 0/1 input.
+    for n in range(11):
+        for bits in itertools.product([0, 1], repeat=n):
+            assert network_sort(list(bits), NETWORKS[name]) == sorted(bits)
+
+
+@pytest.mark.parametrize("name", sorted(NETWORKS))
+@pytest.mark.parametrize(
+    "input_list",
+    [
+        [],
+        [5],
+        REPEATED_ITEMS,
+        [random.randint(0, 1000) for _ in range(100)],
+    ],
+)
+def test_network_sort_and_aav86_base_case(name, input_list):
+    network = NETWORKS[name]
+    counter = CountingCompareAggregate(compare_direct)
+    assert network_sort(input_list, network, counter) == sorted(input_list)
+    cost = network_cost(network(len(input_list)))
+    assert (counter.rounds, counter.edges) == (cost["depth"], cost["comparators"])
+    assert aav86_sort(list(input_list), 3, network) == sorted(input_list)
+
+
+def test_network_costs():
+    costs = {name: network_cost(NETWORKS[name](16)) for name in NETWORKS}
+    assert costs["bitonic"] == {"comparators": 80, "depth": 10}
+    assert costs["odd_even_merge"] == {"comparators": 63, "depth": 10}
+    assert costs["pairwise"] == {"comparators": 63, "depth": 10}
+    bitonic = network_cost(NETWORKS["bitonic"](100))["comparators"]
+    assert network_cost(NETWORKS["odd_even_merge"](100))["comparators"] < bitonic
+    assert network_cost(NETWORKS["pairwise"](100))["comparators"] < bitonic
+
+
+@pytest.mark.parametrize("n", [0, 1, 2, 7, 100, 1000])
+@pytest.mark.parametrize("k", [1, 3, 20])
+def test_sorted_top_k_two_round(n, k):
+    input_list = [random.randint(0, n) for _ in range(n)]
+    counter = CountingCompareAggregate()
+    assert sorted_top_k_two_round_ca(input_list, k, counter) == sorted(input_list)[:k]
+    assert counter.rounds <= 2
+    assert counter.edges == top_k_edges(n, k)
+    largest = sorted_top_k_two_round_ca(input_list, k, largest=True)
+    assert largest == sorted(input_list, reverse=True)[:k]
+
+
+def test_batched_top_k_shares_rounds():
+    instances = [[random.randint(0, 50) for _ in range(n)] for n in range(0, 300, 7)]
+    counter = CountingCompareAggregate()
+    result = batched_sorted_top_k_ca(instances, 5, counter)
+    for x, indices in zip(instances, result):
+        assert [x[i] for i in indices] == sorted(x)[:5]
+    assert counter.calls == counter.rounds == 2
+    assert counter.edges == sum(top_k_edges(len(x), 5) for x in instances)
+
+
+def test_auctions():
+    auctions = [
+        [("a", 10), ("b", 30), ("c", 20)],
+        [("a", 5), ("b", 7), ("c", 7), ("d", 1)],
+        [("a", 3)],
+        [],
+    ]
+    results, report = auction.run_auctions(auctions, k=1, reserve=2)
+    assert results[0] == {
+        "winners": ["b"],
+        "winning_bids": [30],
+        "price": 20,
+        "rounds": 1,
+        "edges": 3,
+    }
+    outcomes = [(r["winners"], r["winning_bids"], r["price"]) for r in results]
+    # Ties go to the earlier bid.
+    assert outcomes[1:] == [(["b"], [7], 7), (["a"], [3], 2), ([], [], 2)]
+    assert [(r["rounds"], r["edges"]) for r in results[1:]] == [(1, 6), (0, 0), (0, 0)]
+    assert report["rounds"] <= 2 and report["max_rounds_per_auction"] == 1
+    assert report["mean_edges_per_auction"] == (3 + 6) / 4
+
+    bids = [[(b, random.randint(0, 100)) for b in range(200)] for _ in range(20)]
+    results, report = auction.run_auctions(bids, k=3)
+    for auction_bids, result in zip(bids, results):
+        ranked = sorted(auction_bids, key=lambda b: -b[1])
+        assert result["winning_bids"] == [b for _, b in ranked[:3]]
+        assert result["price"] == ranked[3][1]
+    assert report["rounds"] == report["max_rounds_per_auction"] == 2
+    assert all(result["rounds"] == 2 for result in results)
+    assert report["edges"] == sum(result["edges"] for result in results)
+    assert report["edges"] == 20 * report["mean_edges_per_auction"]
+    assert report["auctions_per_second"] > 0
+
+
+@pytest.mark.parametrize("largest", [False, True])
+@pytest.mark.parametrize("window", [1, 7, 50])
+def test_sliding_window_top_k(largest, window):
+    counter = CountingCompareAggregate()
+    top = SlidingWindowTopK(3, window=window, CompareAggregate=counter, largest=largest)
+    stream = []
+    for _ in range(40):
+        batch = [random.randint(0, 20) for _ in range(random.randint(0, 6))]
+        candidates, edges = top.num_candidates, counter.edges
+        stream.extend(batch)
+        assert top.update(batch) == sorted(stream[-window:], reverse=largest)[:3]
+        # One call over the candidates and the arrivals only.
+        b = len(batch)
+        assert counter.edges - edges == b * candidates + b * (b - 1) // 2
+    assert counter.calls <= 40
+
+
+@pytest.mark.parametrize("largest", [False, True])
+def test_sliding_window_top_k_monotone_stream(largest):
+    window, b = 100, 10
+    values = list(range(500))
+    worsening = values[::-1] if largest else values
+    counter = CountingCompareAggregate()
+    top = SlidingWindowTopK(3, window=window, CompareAggregate=counter, largest=largest)
+    for start in range(0, len(values), b):
+        candidates, edges = top.num_candidates, counter.edges
+        top.update(worsening[start : start + b])
+        # Nothing is ever beaten by a later element: the whole window stays.
+        assert top.num_candidates == min(start + b, window)
+        assert counter.edges - edges == b * candidates + b * (b - 1) // 2
+    assert counter.edges - edges == b * window + b * (b - 1) // 2
+
+    # A stream that only gets better keeps just k candidates.
+    top = SlidingWindowTopK(3, window=window, largest=largest)
+    improving = worsening[::-1]
+    for start in range(0, len(values), b):
+        top.update(improving[start : start + b])
+        assert top.num_candidates == 3
+
+
+def test_stream_top_k_time_window():
+    batches, t = [], 0.0
+    for _ in range(30):
+        batch = []
+        for _ in range(random.randint(1, 5)):
+            t += random.random()
+            batch.append((t, random.random()))
+        batches.append(batch)
+    seen = []
+    for batch, top in zip(batches, stream_top_k(batches, 4, duration=3.0)):
+        seen.extend(batch)
+        now = batch[-1][0]
+        assert top == sorted(v for ts, v in seen if ts > now - 3.0)[:4]
+
+
+class SlowBackend:
+    """Async backend with latency that records its prepared graphs."""
+
+    def __init__(self):
+        self.prepared = 0
+
+    async def prepare(self, num_vertices, H):
+        self.prepared += 1
+
+    async def __call__(self, x, H):
+        await asyncio.sleep(0.001)
+        return compare_aggregate(x, H)
+
+
+@pytest.mark.parametrize("n", [0, 1, 2, 50, 500])
+def test_async_algorithms(n):
+    input_list = [random.randint(0, n) for _ in range(n)]
+    backend = SlowBackend()
+    scheduler = RoundScheduler(backend)
+    assert asyncio.run(aav86_sort_ca_async(input_list, 3, scheduler)) == sorted(
+        input_list
+    )
+    assert scheduler.rounds <= 3
+    assert backend.prepared == scheduler.calls
+    if n >= 50:
+        # One call per level now orders the pivots too (`derive_subranking`),
+        # so only the sibling partitions of a level are in flight together.
+        assert scheduler.peak_in_flight > 1
+
+    scheduler = RoundScheduler(to_async(), max_in_flight=1)
+    result = asyncio.run(max_two_iteration_ca_async(input_list, scheduler))
+    assert result == max_two_iteration_ca(input_list)
+    counter = CountingCompareAggregate()
+    max_two_iteration_ca(input_list, counter)
+    assert (scheduler.calls, scheduler.rounds, scheduler.edges) == (
+        counter.calls,
+        counter.rounds,
+        counter.edges,
+    )
+
+
+def test_round_scheduler_gather_rounds():
+    scheduler = RoundScheduler(SlowBackend(), max_in_flight=2)
+
+    async def chain(length):
+        for _ in range(length):
+            await scheduler([2, 1], [(0, 1)])
+
+    async def main():
+        await scheduler.gather(chain(1), chain(3), chain(2))
+        await chain(1)
+
+    asyncio.run(main())
+    assert (scheduler.calls, scheduler.rounds) == (7, 4)
+    assert [r for r, _, _ in scheduler.log].count(0) == 3
+    assert scheduler.peak_in_flight == 2
+
+
+def test_composite_keys():
+    n = 200
+    prices = [random.randint(0, 20) for _ in range(n)]
+    times = [random.randint(-5, 5) for _ in range(n)]
+    bidders = [random.randint(0, 3) for _ in range(n)]
+    columns = [prices, times, bidders]
+    directions = [True, False, False]
+    expected = sorted(range(n), key=lambda i: (-prices[i], times[i], bidders[i], i))
+
+    bounds = [(0, 20), (-5, 5), (0, 3)]
+    keys, layout = composite_keys.pack_keys(columns, directions, bounds, max_bits=64)
+    assert sorted(range(n), key=keys.__getitem__) == expected
+    assert layout.bits == 5 + 4 + 2 + 8
+    # Derived bounds only cover the values that occur.
+    _, derived = composite_keys.pack_keys(columns, directions)
+    assert derived.bounds == [(min(c), max(c)) for c in columns]
+    assert composite_keys.unpack_keys(keys, layout) == (columns, list(range(n)))
+    with pytest.raises(ValueError):
+        composite_keys.pack_keys(columns, directions, max_bits=16)
+    with pytest.raises(ValueError):
+        composite_keys.pack_keys([[5, 1]], bounds=[(0, 4)])
+
+    counter = CountingCompareAggregate()
+    assert composite_keys.composite_sort_ca(columns, directions, counter) == expected
+    assert counter.rounds <= 3
+    assert composite_keys.composite_top_k_ca(columns, 5, directions) == expected[:5]
+    assert composite_keys.composite_sort_ca([[7]]) == [0]
+
+
+def test_vectorized_backend():
+    backends = pytest.importorskip("backends")
+    n = 60
+    H = [(i, j) for i in range(n) for j in range(n) if i != j and random.random() < 0.3]
+    x = [random.randint(0, 5) for _ in range(n)]
+    assert backends.vectorized_compare_aggregate(x, H) == compare_aggregate(x, H)
+    assert backends.vectorized_compare_aggregate(x, []) == [0] * n
+    rows = [(random.randint(0, 3), random.randint(0, 3)) for _ in range(n)]
+    assert backends.vectorized_compare_aggregate(rows, H) == compare_aggregate(rows, H)
+    # Direction flags: same as negating the descending column.
+    flagged = backends.lexicographic_compare_aggregate([True, False])
+    negated = [(-a, b) for a, b in rows]
+    assert flagged(rows, H) == compare_aggregate(negated, H)
+    assert aav86_sort_ca(rows, 2, flagged) == sorted(rows, key=lambda r: (-r[0], r[1]))
+    assert "vectorized" in cli.BACKENDS
+
+
+def test_dedupe_edges_and_derived_subranking():
+    assert graph_optimizer.dedupe_edges([(1, 0), (0, 1), (2, 3), (0, 1), (3, 2)]) == [
+        (0, 1),
+        (2, 3),
+    ]
+    n = 40
+    x = [random.randint(0, 10) for _ in range(n)]
+    subset = random.sample(range(n), 6)
+    outside = [v for v in range(n) if v not in subset and random.random() < 0.5]
+    H = [(min(v, s), max(v, s)) for v in outside for s in subset]
+    H += [(s, t) for s in subset for t in subset if s < t]
+    subranks = graph_optimizer.derive_subranking(H, compare_aggregate(x, H), subset)
+    # Same as a separate call on the subset, in the subset's index order.
+    in_index_order = sorted(subset)
+    direct = compare_aggregate([x[v] for v in in_index_order], complete_graph(6))
+    assert subranks == [direct[in_index_order.index(v)] for v in subset]
+    with pytest.raises(ValueError):
+        graph_optimizer.derive_subranking(H[1:], compare_aggregate(x, H), subset)
+
+
+def test_optimize_schedule(tmp_path):
+    path = str(tmp_path / "aav86.cags")
+    input_list = [random.randint(0, 1000) for _ in range(500)]
+    with graph_format.GraphScheduleWriter(path) as ca:
+        aav86_sort_ca(input_list, 3, ca)
+    with graph_format.GraphSchedule(path) as schedule:
+        calls, report = graph_optimizer.optimize_schedule(
+            (r.round, r.num_vertices, r.to_edges()) for r in schedule
+        )
+    assert report["calls_before"] == ca.calls > report["calls_after"] == ca.rounds
+    assert report["edges_before"] == report["edges_after"] == ca.edges
+    assert [r for r, _, _ in calls] == list(range(ca.rounds))
+    assert sum(v for _, v, _ in calls) == sum(v for _, v, _ in ca.log)
+
+
+def test_round_scheduler_coalesces_rounds():
+    input_list = [random.randint(0, 1000) for _ in range(1000)]
+    scheduler = RoundScheduler(SlowBackend(), coalesce=True)
+    assert asyncio.run(aav86_sort_ca_async(input_list, 3, scheduler)) == sorted(
+        input_list
+    )
+    assert scheduler.calls > scheduler.backend_calls == scheduler.rounds == 3
+
+
+@pytest.mark.parametrize("metric", ["sqeuclidean", "euclidean", "manhattan"])
+def test_knn(metric):
+    np = pytest.importorskip("numpy")
+    knn = pytest.importorskip("knn")
+    rng = np.random.default_rng(1)
+    queries, references = rng.normal(size=(20, 3)), rng.normal(size=(300, 3))
+    counter = CountingCompareAggregate()
+    neighbors, report = knn.knn_ca(queries, references, 4, counter, metric)
+    distances = knn.pairwise_distances(queries, references, metric)
+    assert neighbors == np.argsort(distances, axis=1, kind="stable")[:, :4].tolist()
+    assert counter.calls == report["rounds"] == report["rounds_per_query"] == 2
+    assert report["edges"] == 20 * report["edges_per_query"] < 20 * 300 * 299 // 2
+    assert report["queries_per_second"] > 0
+
+
+@pytest.mark.parametrize("n, distinct", [(1000, 1), (5000, 4), (20000, 11)])
+def test_quantiles_ties(n, distinct):
+    input_list = [random.randrange(distinct) for _ in range(n)]
+    quantiles = [0.5, 0.9, 0.99, 0.999]
+    counter = CountingCompareAggregate()
+    expected = sorted(input_list)
+    result = quantiles_ca(input_list, quantiles, counter)
+    assert result == [expected[int(q * n)] for q in quantiles]
+    # Equal values are split by index, so windows and buckets stay small.
+    assert "clique" not in counter.fallbacks
+    assert counter.edges <= 20 * len(quantiles) * n
+
+
+@pytest.mark.parametrize("n", [0, 1, 50, 1000, 5000])
+def test_multi_select(n):
+    input_list = [random.randint(0, n // 3) for _ in range(n)]
+    expected = sorted(input_list)
+    quantiles = [0.5, 0.9, 0.99, 0.999]
+    counter = CountingCompareAggregate()
+    result = quantiles_ca(input_list, quantiles, counter)
+    assert result == [expected[int(q * n)] if n else None for q in quantiles]
+    if n >= 1000:
+        attempts = 1 + counter.fallbacks.get("window_missed", 0)
+        assert counter.rounds <= 3 + attempts
+        if not counter.fallbacks:
+            # Linear in n per target, about 10n for a central quantile.
+            assert counter.edges <= 20 * len(quantiles) * n
+    ranks = random.sample(range(n), min(n, 5))
+    assert multi_select_ca(input_list, ranks) == [expected[r] for r in ranks]
+    with pytest.raises(IndexError):
+        multi_select_ca([1, 2, 3], [3])
+
+
+def test_transcript_roundtrip(tmp_path):
+    path = str(tmp_path / "aav86.catr")
+    input_list = [random.randint(-1000, 1000) for _ in range(300)]
+    recorder = transcript.TranscriptRecorder()
+    assert aav86_sort_ca(input_list, 3, recorder) == sorted(input_list)
+    recorder.save(path)
+    loaded = transcript.load_transcript(path)
+    assert [(c.round, c.num_vertices, len(c.H)) for c in loaded] == recorder.log
+    for call, original in zip(loaded, recorder.transcript):
+        assert (call.x, call.H, call.ranks) == (original.x, original.H, original.ranks)
+
+    rows = transcript.TranscriptRecorder()
+    rows([(1, 0.5), (1, 0.25)], [(0, 1)])
+    rows.save(path)
+    assert transcript.load_transcript(path)[0].x == [(1, 0.5), (1, 0.25)]
+    with pytest.raises(ValueError):
+        transcript.save_transcript(
+            path, [transcript.TranscriptCall(0, 1, ["a"], [], [0])]
+        )
+
+
+def test_transcript_replay(tmp_path):
+    backends = pytest.importorskip("backends")
+    path = str(tmp_path / "median.catr")
+    input_list = [random.randint(0, 10**6) for _ in range(2000)]
+    recorder = transcript.TranscriptRecorder()
+    median_BB90_4iter_CA(input_list, recorder)
+    recorder.save(path)
+    report = transcript.replay(
+        transcript.load_transcript(path),
+        {
+            "cleartext": compare_aggregate,
+            "vectorized": backends.vectorized_compare_aggregate,
+            "two-party": backends.SimulatedTwoPartyCompareAggregate(seed=1),
+        },
+        repeat=2,
+    )
+    for backend_report in report.values():
+        assert backend_report["mismatches"] == 0
+        assert backend_report["calls"] == recorder.calls
+        assert backend_report["edges"] == recorder.edges
+        assert len(backend_report["round_seconds"]) == recorder.rounds
+
+    # Shapes only: every backend gets the same random inputs.
+    shapes = transcript.TranscriptRecorder(record_inputs=False)
+    aav86_sort_ca(input_list, 3, shapes)
+    shapes.save(path)
+    loaded = transcript.load_transcript(path)
+    assert all(call.x is None for call in loaded)
+    report = transcript.replay(
+        loaded,
+        {
+            "cleartext": compare_aggregate,
+            "two-party": backends.SimulatedTwoPartyCompareAggregate(),
+        },
+        verify=True,
+    )
+    assert report["two-party"]["mismatches"] == 0
+
+
+def test_cached_ranker():
+    input_list = [random.randint(0, 100) for _ in range(500)]
+    expected = sorted(input_list)
+    data = ca_cache.VersionedDataset(input_list)
+    counter = CountingCompareAggregate()
+    ranker = ca_cache.CachedRanker(data, counter)
+    assert ranker.median() == expected[250]
+    calls = counter.calls
+    assert ranker.percentile(0.99) == expected[495]
+    assert ranker.top_k(5) == expected[:5]
+    assert ranker.top_k(5, largest=True) == expected[::-1][:5]
+    assert ranker.select(42) == expected[42]
+    assert counter.calls == calls
+    assert ranker.report()["hits"] == 4 and ranker.report()["misses"] == 1
+
+    version = data.version
+    data[0] = 1000
+    assert data.version != version
+    assert ranker.top_k(1, largest=True) == [1000]
+    assert counter.calls > calls
+    assert ranker.report()["invalidations"] == 1
+    assert ca_cache.CachedRanker(ca_cache.VersionedDataset()).median() is None
+
+
+def test_caching_compare_aggregate():
+    data = ca_cache.VersionedDataset(random.randint(0, 100) for _ in range(200))
+    counter = CountingCompareAggregate()
+    cached = ca_cache.CachingCompareAggregate(data, counter, max_bytes=2000)
+    first = sorted_top_k_CA(list(data), 10, cached)
+    assert sorted_top_k_CA(list(data), 10, cached) == first
+    assert counter.calls == 1
+    assert cached.report()["hits"] == 1
+    # Entries over the size bound are not cached; older ones are evicted.
+    sorted_top_k_CA(list(range(600)), 10, cached)
+    assert cached.report()["bytes"] <= 2000
+    for n in (300, 301):
+        sorted_top_k_CA(list(range(n)), 10, cached)
+    assert cached.report()["evictions"] >= 1
+    data.append(5)
+    sorted_top_k_CA(list(data)[:200], 10, cached)
+    assert counter.calls == 5
+    # Parallel calls still share rounds through the wrapper.
+    rounds = counter.rounds
+    assert aav86_sort_ca(list(data), 3, cached) == sorted(data)
+    assert counter.rounds == rounds + 3
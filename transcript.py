@@ -0,0 +1,288 @@
+"""
+Recording and replay of CompareAggregate transcripts.
+
+A transcript is the exact sequence of CompareAggregate calls one run of an
+algorithm made: the round, input and graph of every call, and the ranks it
+returned. Replaying a transcript against several backends times them on the
+same inputs and graphs, free of the algorithm's own randomness and
+bookkeeping:
+
+    recorder = TranscriptRecorder()
+    aav86_sort_ca(x, 3, recorder)
+    recorder.save("aav86.catr")
+
+    transcript = load_transcript("aav86.catr")
+    report = replay(transcript, {"cleartext": compare_aggregate,
+                            "vectorized": vectorized_compare_aggregate})
+
+File format (little-endian). A file header as in `graph_format`, with the
+magic b"CATR" and flags in place of the reserved field (INPUTS: inputs are
+stored, RANKS: ranks are stored). Then, for every call, a `graph_format`
+record (round, size and graph, cliques and bicliques stored symbolically),
+followed by the input and the ranks if flagged:
+
+    input header (8 bytes): typecode c (b"q": int64, b"d": float64),
+                            columns u8 (0: scalars, else tuple width),
+                            2 pad, count u32 (number of stored values)
+    input payload:          typecode[count]
+    ranks:                  int32[num_vertices]
+
+Transcripts recorded with `record_inputs=False` keep only the shapes; replay
+then draws the inputs at random (the same ones for every backend).
+"""
+
+import numbers
+import random
+import struct
+import sys
+import time
+from array import array
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+from compare_aggregate import (
+    compare_aggregate,
+    CompareAggregateFn,
+    CountingCompareAggregate,
+)
+from graph_format import read_record, write_record
+
+MAGIC = b"CATR"
+FORMAT_VERSION = 1
+
+# File header flags.
+INPUTS = 1
+RANKS = 2
+
+_FILE_HEADER = struct.Struct("<4sHH")
+_INPUT_HEADER = struct.Struct("<cB2xI")
+_INT64 = (-(2**63), 2**63 - 1)
+
+
+class TranscriptCall:
+    """
+    One recorded CompareAggregate call: its round, input size, input (None if
+    only the shape was recorded), graph and ranks (None if not recorded).
+    """
+
+    __slots__ = ("round", "num_vertices", "x", "H", "ranks")
+
+    def __init__(
+        self,
+        round_index: int,
+        num_vertices: int,
+        x: Optional[List[Any]],
+        H: List[Tuple[int, int]],
+        ranks: Optional[List[int]],
+    ):
+        self.round = round_index
+        self.num_vertices = num_vertices
+        self.x = x
+        self.H = H
+        self.ranks = ranks
+
+    def __repr__(self) -> str:
+        return f"TranscriptCall(round={self.round}, edges={len(self.H)})"
+
+
+class TranscriptRecorder(CountingCompareAggregate):
+    """
+    A CompareAggregate wrapper that records every call it forwards.
+
+    Args:
+        CompareAggregate: The backend the calls are forwarded to.
+        record_inputs: If False, keep only the input sizes (and no ranks),
+            e.g. for inputs that must not be stored.
+
+    Attributes:
+        transcript: The recorded calls, in call order.
+    """
+
+    def __init__(
+        self,
+        CompareAggregate: CompareAggregateFn = compare_aggregate,
+        record_inputs: bool = True,
+    ):
+        super().__init__(CompareAggregate)
+        self.record_inputs = record_inputs
+        self.transcript: List[TranscriptCall] = []
+
+    def __call__(self, x: List[Any], H: List[Tuple[int, int]]) -> List[int]:
+        round_index = self._round
+        ranks = super().__call__(x, H)
+        self.transcript.append(
+            TranscriptCall(
+                round_index,
+                len(x),
+                list(x) if self.record_inputs else None,
+                list(H),
+                list(ranks) if self.record_inputs else None,
+            )
+        )
+        return ranks
+
+    def save(self, path: str) -> None:
+        """Writes the transcript to `path`."""
+        save_transcript(path, self.transcript)
+
+
+def _encode_inputs(x: List[Any]) -> Tuple[bytes, int, List[Any]]:
+    """Returns the typecode, the number of columns and the flat values of x."""
+    columns = 0
+    values: List[Any] = list(x)
+    if x and isinstance(x[0], tuple):
+        columns = len(x[0])
+        if columns == 0 or columns > 255 or any(len(row) != columns for row in x):
+            raise ValueError("rows must be tuples of equal length (at most 255)")
+        values = [v for row in x for v in row]
+    if all(isinstance(v, numbers.Integral) for v in values):
+        if values and not _INT64[0] <= min(values) <= max(values) <= _INT64[1]:
+            raise ValueError("integer inputs must fit into int64")
+        return b"q", columns, values
+    if all(isinstance(v, numbers.Real) for v in values):
+        return b"d", columns, values
+    raise ValueError("only numbers and tuples of numbers can be recorded")
+
+
+def _write_array(f: BinaryIO, typecode: str, values: List[Any]) -> None:
+    a = array(typecode, values)
+    if sys.byteorder != "little":
+        a.byteswap()
+    f.write(a.tobytes())
+
+
+def _read_array(buffer: bytes, offset: int, typecode: str, count: int):
+    a = array(typecode)
+    a.frombytes(buffer[offset : offset + a.itemsize * count])
+    if sys.byteorder != "little":
+        a.byteswap()
+    return a.tolist(), offset + a.itemsize * count
+
+
+def save_transcript(path: str, transcript: List[TranscriptCall]) -> None:
+    """
+    Writes `transcript` (e.g. `TranscriptRecorder.transcript`) to `path`.
+    Inputs and ranks are stored if every call has them.
+
+    Raises:
+        ValueError: If an input holds anything but numbers or equal-length
+            tuples of numbers; record such runs with `record_inputs=False`.
+    """
+    flags = 0
+    if transcript and all(call.x is not None for call in transcript):
+        flags |= INPUTS
+    if transcript and all(call.ranks is not None for call in transcript):
+        flags |= RANKS
+    with open(path, "wb") as f:
+        f.write(_FILE_HEADER.pack(MAGIC, FORMAT_VERSION, flags))
+        for call in transcript:
+            write_record(f, call.round, call.num_vertices, call.H)
+            if flags & INPUTS:
+                typecode, columns, values = _encode_inputs(call.x)
+                f.write(_INPUT_HEADER.pack(typecode, columns, len(values)))
+                _write_array(f, typecode.decode(), values)
+            if flags & RANKS:
+                _write_array(f, "i", call.ranks)
+
+
+def load_transcript(path: str) -> List[TranscriptCall]:
+    """Reads a transcript written by `save_transcript`."""
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, flags = _FILE_HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a CA transcript")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"unsupported transcript format version {version}")
+    buffer = memoryview(data)
+    transcript: List[TranscriptCall] = []
+    offset = _FILE_HEADER.size
+    while offset < len(data):
+        views: List[memoryview] = []
+        record, offset = read_record(buffer, offset, views)
+        H = record.to_edges()
+        for view in reversed(views):
+            view.release()
+        x = ranks = None
+        if flags & INPUTS:
+            typecode, columns, count = _INPUT_HEADER.unpack_from(data, offset)
+            offset += _INPUT_HEADER.size
+            values, offset = _read_array(data, offset, typecode.decode(), count)
+            if columns:
+                x = [tuple(values[i : i + columns]) for i in range(0, count, columns)]
+            else:
+                x = values
+        if flags & RANKS:
+            ranks, offset = _read_array(data, offset, "i", record.num_vertices)
+        transcript.append(
+            TranscriptCall(record.round, record.num_vertices, x, H, ranks)
+        )
+    buffer.release()
+    return transcript
+
+
+def replay(
+    transcript: List[TranscriptCall],
+    backends: Dict[str, CompareAggregateFn],
+    repeat: int = 1,
+    seed: int = 0,
+    verify: bool = True,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Replays a transcript against several backends and times them.
+
+    Every backend gets the same inputs and graphs, in the recorded order.
+    Transcripts without inputs are replayed on random integer inputs drawn
+    with `seed`.
+
+    Args:
+        transcript: The recorded calls.
+        backends: Backend name -> CompareAggregate function.
+        repeat: Number of replays per backend; the fastest one is reported.
+        seed: Seed for the inputs of transcripts recorded without them.
+        verify: If True, count the calls whose ranks differ from the
+            recorded ranks (or, if none were recorded, from the first
+            backend's).
+
+    Returns:
+        For every backend: the number of `calls`, `edges` and `rounds`, the
+        total `seconds`, the seconds per round (`round_seconds`) and the
+        number of `mismatches`.
+    """
+    rng = random.Random(seed)
+    inputs = [
+        (
+            call.x
+            if call.x is not None
+            else [rng.randrange(2**31) for _ in range(call.num_vertices)]
+        )
+        for call in transcript
+    ]
+    expected = [call.ranks for call in transcript]
+    num_rounds = max((call.round for call in transcript), default=-1) + 1
+    reports: Dict[str, Dict[str, Any]] = {}
+    for name, backend in backends.items():
+        best: Optional[List[float]] = None
+        for _ in range(repeat):
+            seconds = [0.0] * num_rounds
+            results = []
+            for call, x in zip(transcript, inputs):
+                start = time.perf_counter()
+                ranks = backend(x, call.H)
+                seconds[call.round] += time.perf_counter() - start
+                results.append(ranks)
+            if best is None or sum(seconds) < sum(best):
+                best = seconds
+        mismatches = 0
+        if verify:
+            if any(e is None for e in expected):
+                expected = results
+            mismatches = sum(1 for r, e in zip(results, expected) if list(r) != e)
+        reports[name] = {
+            "calls": len(transcript),
+            "edges": sum(len(call.H) for call in transcript),
+            "rounds": num_rounds,
+            "seconds": sum(best) if best else 0.0,
+            "round_seconds": best or [],
+            "mismatches": mismatches,
+        }
+    return reports